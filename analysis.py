@@ -1,9 +1,9 @@
 import pandas as pd
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
 import numpy as np
 import util
 
+# plotly and matplotlib are slow to import, so they are imported inside the plotting functions
+
 
 font = {#'family': 'serif',
         # 'color':  'darkred',
@@ -13,6 +13,8 @@ font = {#'family': 'serif',
 
 
 def plotCandlesticks():
+    import plotly.graph_objects as go
+
     df = pd.read_csv('datasets/LTC.csv', parse_dates=['Date'])
 
     fig = go.Figure()
@@ -30,45 +32,80 @@ def plotCandlesticks():
     fig.show()
 
 
-def plotMetrics(df, strategyName, savePath=None):
+def getEnvelopeIndices(y, nBuckets):
+    """ Downsampling that preserves the envelope of a series: y is split in nBuckets buckets and the indices of the
+        minimum and the maximum of each bucket are returned, sorted. With one bucket per pixel the plot looks the same
+        as the full series, drawdown spikes included, with at most 2 * nBuckets points.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if nBuckets is None or n <= 2 * nBuckets:
+        return np.arange(n)
+
+    bucketSize = int(np.ceil(n / nBuckets))
+    padded = np.full(bucketSize * int(np.ceil(n / bucketSize)), np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(-1, bucketSize)
+    isNan = np.isnan(buckets)
+    offsets = np.arange(buckets.shape[0]) * bucketSize
+    iMin = np.argmin(np.where(isNan, np.inf, buckets), axis=1) + offsets
+    iMax = np.argmax(np.where(isNan, -np.inf, buckets), axis=1) + offsets
+
+    indices = np.unique(np.concatenate(([0, n - 1], iMin, iMax)))
+    return indices[indices < n]
+
+
+def plotMetrics(df, strategyName, savePath=None, decimate=True):
+    """ Plots price, equity and drawdown. If decimate is True every series is reduced to its min/max envelope with one
+        bucket per horizontal pixel before drawing, which keeps long runs of 1m data fast to plot.
+    """
+    import matplotlib.pyplot as plt
+
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(16, 8), sharex='col')
     figName = strategyName.replace('_', ', ')
     fig.suptitle(figName, fontsize=14)
 
+    nBuckets = int(fig.get_size_inches()[0] * fig.dpi) if decimate else None
     x = df.index
-    p0 = df['MarkPrice'][0]
-    e0 = df['Equity'][0]
+    price = df['MarkPrice'].to_numpy(dtype=float)
+    equity = df['Equity'].to_numpy(dtype=float)
+    drawdown = df['Drawdown %'].to_numpy(dtype=float)
+    p0 = price[0]
+    e0 = equity[0]
 
+    i = getEnvelopeIndices(price, nBuckets)
     ax1.set_title('Price')
-    ax1.plot(x, df['MarkPrice'], linewidth=1.3)
+    ax1.plot(x[i], price[i], linewidth=1.3)
     lbl = ax1.set_ylabel('$', labelpad=10)
     lbl.set_rotation(0)
     ax1b = ax1.twinx()
-    ax1b.plot(x, (df['MarkPrice'] - p0) / p0 * 100, linewidth=0)
+    ax1b.plot(x[i], (price[i] - p0) / p0 * 100, linewidth=0)
     lbl = ax1b.set_ylabel('%', labelpad=10)
     lbl.set_rotation(0)
     ax1.grid()
 
+    i = getEnvelopeIndices(equity, nBuckets)
     ax2.set_title('Equity')
-    ax2.plot(x, df['Equity'], linewidth=1)
-    ax2.fill_between(x, df['Equity'][0], df['Equity'], alpha=0.5)
+    ax2.plot(x[i], equity[i], linewidth=1)
+    ax2.fill_between(x[i], e0, equity[i], alpha=0.5)
     lbl = ax2.set_ylabel('$', labelpad=10)
     lbl.set_rotation(0)
     ax2.ticklabel_format(axis='y', useOffset=False)
     ax2b = ax2.twinx()
-    ax2b.plot(x, (df['Equity'] - e0) / e0 * 100, linewidth=0)
+    ax2b.plot(x[i], (equity[i] - e0) / e0 * 100, linewidth=0)
     lbl = ax2b.set_ylabel('%', labelpad=10)
     lbl.set_rotation(0)
     ax2.grid()
 
+    i = getEnvelopeIndices(drawdown, nBuckets)
     ax3.set_title('Drawdown')
-    ax3.plot(x, df['Drawdown %'] * e0/100, color='red', linewidth=1)
+    ax3.plot(x[i], drawdown[i] * e0/100, color='red', linewidth=1)
     lbl = ax3.set_ylabel('$', labelpad=10)
     lbl.set_rotation(0)
     ax3.set_xlabel('Time', labelpad=10)
     ax3b = ax3.twinx()
-    ax3b.plot(x, df['Drawdown %'], color='red', linewidth=0)
-    ax3b.fill_between(x, 0, df['Drawdown %'], alpha=0.5, facecolor='red')
+    ax3b.plot(x[i], drawdown[i], color='red', linewidth=0)
+    ax3b.fill_between(x[i], 0, drawdown[i], alpha=0.5, facecolor='red')
     lbl = ax3b.set_ylabel('%', labelpad=10)
     lbl.set_rotation(0)
     ax3.grid()
@@ -77,54 +114,59 @@ def plotMetrics(df, strategyName, savePath=None):
         fig.savefig(savePath)
 
 
+def computeGridStatistics(df):
+    """ Returns a dataframe indexed by grid number with the number of closed positions (take profits and stop losses),
+        their frequency, the net profit and the percentage of the total net profit of each grid.
+        Vectorized, so it can be computed cheaply for every run of a sweep.
+    """
+    netProfit = df['NetProfit'].to_numpy(dtype=float)
+    closed = ~np.isnan(netProfit)
+    grids = df['GridReached'].to_numpy()[closed].astype(int)
+    netProfit = netProfit[closed]
+
+    nGrids = grids.max() if len(grids) > 0 else 0
+    counts = np.bincount(grids, minlength=nGrids + 1)
+    gridNetProfit = np.bincount(grids, weights=netProfit, minlength=nGrids + 1)
+    totalNetProfit = netProfit.sum()
+
+    # check the sum of grid profits is equal to the total profit
+    if abs(df['NetProfit'].sum() - gridNetProfit.sum()) > 0.0001:
+        util.logger.error("The sum of the grid profits is not equal to the total profits")
+
+    stats = pd.DataFrame({
+        'ClosedPositions': counts,
+        'Frequency': counts / max(counts.sum(), 1),
+        'NetProfit': gridNetProfit,
+        'Profit %': gridNetProfit / totalNetProfit * 100 if totalNetProfit != 0 else np.zeros(nGrids + 1),
+    })
+    stats.index.name = 'Grid'
+    return stats
+
+
 def plotDistributions(df, savePath=None):
+    import matplotlib.pyplot as plt
+
+    stats = computeGridStatistics(df)
+    if stats['ClosedPositions'].sum() == 0:
+        util.logger.warning("No closed positions, the distributions cannot be plotted")
+        return
+
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
     # fig.suptitle('Distribution of take profits', fontsize=14)
 
-    # get grid reached for each profit
-    profitGridReached = []
-    for i in range(len(df.index)):
-        if not np.isnan(df['NetProfit'][i]):
-            profitGridReached.append(df['GridReached'][i])
-
-    data = np.array(profitGridReached)
-    bins = np.arange(0, data.max() + 1.5) - 0.5
-    ax1.hist(data, bins, rwidth=0.7, density=True)
-    ax1.set_xticks(bins + 0.5)
-    ax1.set_xlim([0.1, data.max() + 0.9])
+    nGrids = stats.index.max()
+    ticks = np.arange(0, nGrids + 2)
+
+    ax1.bar(stats.index, stats['Frequency'], width=0.7)
+    ax1.set_xticks(ticks)
+    ax1.set_xlim([0.1, nGrids + 0.9])
     ax1.set_title('Distribution of TP grids', fontdict=font)
     ax1.set_ylabel('Frequency', fontdict=font)
     ax1.set_xlabel('Grid Number', fontdict=font)
 
-    # compute profit contribution of each grid
-    gridProfitDict = {}
-    for i in range(len(df.index)):
-        netProfit = df['NetProfit'][i]
-
-        if not np.isnan(netProfit):
-            grid = int(df['GridReached'][i])
-            if grid in gridProfitDict:
-                gridProfitDict[grid] += netProfit
-            else:
-                gridProfitDict[grid] = netProfit
-
-    # check the sum of grid profits is equal to the total profit
-    totalNetProfit = df['NetProfit'].sum()
-    if abs(totalNetProfit - sum(list(gridProfitDict.values()))) > 0.0001:
-        util.logger.error("The sum of the grid profits is not equal to the total profits")
-
-    nGrids = int(max(list(gridProfitDict.keys())))
-    data = []
-    for i in range (nGrids):
-        if (i+1) in gridProfitDict:
-            data.append(gridProfitDict[i+1] / totalNetProfit * 100)
-        else:
-            gridProfitDict[i] = 0
-            data.append(0)
-
     # distribution of profits
-    ax2.bar(range(1,nGrids+1), data)
-    ax2.set_xticks(bins + 0.5)
+    ax2.bar(stats.index[1:], stats['Profit %'][1:])
+    ax2.set_xticks(ticks)
     ax2.set_xlim([0.1, nGrids + 0.9])
     ax2.set_title('Distribution of by grid', fontdict=font)
     ax2.set_ylabel('Profit %', fontdict=font)
@@ -136,8 +178,20 @@ def plotDistributions(df, savePath=None):
         fig.savefig(savePath)
 
 
-def toRename(df, caseStudy, filePath):
-    profit = df['Equity'].iloc[-1] - df['Equity'][0]
+def computeSummary(df):
+    """ Returns the main performance figures of a simulation as a dictionary. """
+    profit = df['Equity'].iloc[-1] - df['Equity'].iloc[0]
     maxDrawdown = df['Drawdown %'].min()
+    return {
+        'Profit': float(profit),
+        'Profit %': float(profit / df['Equity'].iloc[0] * 100),
+        'MaxDrawdown %': None if np.isnan(maxDrawdown) else float(maxDrawdown),
+        'MaxGridReached': None if df['GridReached'].isna().all() else int(df['GridReached'].max()),
+        'ClosedPositions': int(df['NetProfit'].notna().sum()),
+    }
+
+
+def toRename(df, caseStudy, filePath):
+    summary = computeSummary(df)
     with open(filePath,'a') as f:
-        f.write(f'{caseStudy} -> profit: {profit}, maxDrawdown: {maxDrawdown}\n')
+        f.write(f"{caseStudy} -> profit: {summary['Profit']}, maxDrawdown: {summary['MaxDrawdown %']}\n")
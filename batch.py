@@ -0,0 +1,276 @@
+""" Headless batch runner.
+    Executes all the simulations listed in a JSON or TOML manifest and writes a machine readable summary.
+
+    Usage: python batch.py manifest.json [--workers N] [--summary summary.json] [--summary-only] [--render skip|after|defer] [--quiet]
+
+    Manifest format (JSON, the TOML version uses a [defaults] table and [[runs]] tables):
+    {
+        "defaults": {"initialEquity": 1000, "leverage": 20, "buySell": "LONG",
+                     "startDate": "2021-03-01", "endDate": "2021-03-29",
+                     "GO": 7, "GS": 0.2, "SF": 2, "OS": 0.8, "OF": 2.2, "TS": 0.3, "SL": null,
+                     "abortDrawdown": 50, "abortLiquidation": true},
+        "runs": [
+            {"symbol": "LTCUSDT"},
+            {"symbol": ["BTCUSDT", "ETHUSDT"], "GS": [0.2, 0.3], "windows": [["2021-01-01", "2021-02-01"], ["2021-02-01", "2021-03-01"]]}
+        ]
+    }
+    Every value given as a list is expanded, so a run entry describes the cartesian product of its values.
+    The optional abort keys stop a run as soon as its equity falls below abortEquity, its equity drawdown exceeds
+    abortDrawdown %, the account is liquidated (abortLiquidation: true) or abortStopLosses stop losses are hit.
+    The optional depthSnapshots key (with fillParticipation) simulates the fills on recorded order books, see fillmodel.py.
+"""
+import argparse
+import itertools
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import config
+import render
+import util
+
+
+ABORT_KEYS = ('abortEquity', 'abortDrawdown', 'abortLiquidation', 'abortStopLosses') # optional, see AbortConditions
+FILL_KEYS = ('depthSnapshots', 'fillParticipation') # optional, see fillmodel.py
+RUN_KEYS = ('symbol', 'initialEquity', 'leverage', 'buySell', 'startDate', 'endDate', 'GO', 'GS', 'SF', 'OS', 'OF', 'TS', 'SL') + ABORT_KEYS + FILL_KEYS
+
+
+##### MANIFEST
+def loadManifest(filePath) -> list:
+    """ Parses a JSON or TOML manifest and returns the list of runs, one dictionary per simulation. """
+    filePath = Path(filePath)
+    if filePath.suffix.lower() == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(filePath, 'rb') as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(filePath) as f:
+            manifest = json.load(f)
+
+    defaults = manifest.get('defaults', {})
+    runs = []
+    for runEntry in manifest.get('runs', [{}]):
+        runs += expandRunEntry({**defaults, **runEntry})
+    return runs
+
+
+def expandRunEntry(runEntry) -> list:
+    """ Expands every list value of a run entry, returning the cartesian product of the values. """
+    runEntry = dict(runEntry)
+    windows = runEntry.pop('windows', None)
+    if windows is None:
+        windows = [(runEntry.pop('startDate', None), runEntry.pop('endDate', None))]
+    else:
+        runEntry.pop('startDate', None)
+        runEntry.pop('endDate', None)
+
+    unknownKeys = set(runEntry) - set(RUN_KEYS)
+    if unknownKeys:
+        raise ValueError(f"Unknown manifest keys: {', '.join(sorted(unknownKeys))}")
+
+    keys = list(runEntry.keys())
+    values = [v if isinstance(v, list) else [v] for v in runEntry.values()]
+
+    runs = []
+    for startDate, endDate in windows:
+        for combination in itertools.product(*values):
+            run = dict(zip(keys, combination))
+            run['startDate'] = parseDate(startDate)
+            run['endDate'] = parseDate(endDate)
+            run['symbol'] = run['symbol'].strip().upper()
+            run['buySell'] = run.get('buySell', 'LONG').strip().upper()
+            run.setdefault('SL', None)
+            for key in ABORT_KEYS + FILL_KEYS:
+                run.setdefault(key, None)
+            missingKeys = set(RUN_KEYS) - set(run)
+            if missingKeys:
+                raise ValueError(f"Missing manifest keys: {', '.join(sorted(missingKeys))}")
+            runs.append(run)
+    return runs
+
+
+def parseDate(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if value is None:
+        raise ValueError("Every run needs a start and an end date")
+    return datetime.fromisoformat(str(value))
+
+
+##### RUN EXECUTION
+def applyRunConfig(run) -> None:
+    """ Sets the config.py global variables for the given run. """
+    config.SYMBOL = run['symbol']
+    config.INITIAL_EQUITY = float(run['initialEquity'])
+    config.LEVERAGE = int(run['leverage'])
+    config.BUY_SELL = run['buySell']
+    config.START_DATE = run['startDate']
+    config.END_DATE = run['endDate']
+    config.GO = int(run['GO'])
+    config.GS = float(run['GS'])
+    config.SF = float(run['SF'])
+    config.OS = float(run['OS'])
+    config.OF = float(run['OF'])
+    config.TS = float(run['TS'])
+    config.SL = None if run['SL'] is None else float(run['SL'])
+
+
+def getDatasetFilePath(run) -> str:
+    """ Path of the dataset of a run, without creating its simulator. """
+    return util.getSymbolDataFilePath(run['symbol'], run['startDate'], run['endDate'])
+
+
+def createSimulator(run, recordResults=True, symbolData=None, account=None):
+    import bots
+    from market_engine import AbortConditions
+    from simulator import Simulator
+
+    applyRunConfig(run)
+    abortConditions = AbortConditions(run.get('abortEquity'), run.get('abortDrawdown'), bool(run.get('abortLiquidation')), run.get('abortStopLosses'))
+    fillModel = None
+    if run.get('depthSnapshots') is not None:
+        import fillmodel
+        fillModel = fillmodel.createFillModel(run['depthSnapshots'], run.get('fillParticipation'))
+    bot = bots.createBot(config.BUY_SELL, config.SYMBOL, GO=config.GO, GS=config.GS, SF=config.SF, OS=config.OS, OF=config.OF, TS=config.TS, SL=config.SL)
+    return Simulator(config.INITIAL_EQUITY, config.START_DATE, config.END_DATE, bot, recordResults=recordResults, symbolData=symbolData,
+                     abortConditions=abortConditions, account=account, fillModel=fillModel)
+
+
+def executeRun(runId, run, recordResults=True) -> dict:
+    """ Runs a single simulation and returns its summary. Executed in the worker processes. """
+    summary = {'Id': runId, 'Run': serializeRun(run)}
+    startTime = time.perf_counter()
+    try:
+        simulator = createSimulator(run, recordResults)
+        summary['Status'] = 'cached' if simulator.isCached() else 'simulated'
+        simulator.startSimulation()
+        summary['CacheKey'] = simulator.getCacheKey()
+        if recordResults:
+            summary['ResultsFile'] = simulator.resultsFilePath
+        summary.update(simulator.summary)
+    except Exception as e:
+        util.logger.error(f"Run {runId} failed: {e}")
+        summary['Status'] = 'failed'
+        summary['Error'] = str(e)
+    summary['ElapsedTime'] = time.perf_counter() - startTime
+    return summary
+
+
+def prepareDatasets(runs) -> None:
+    """ Downloads the missing datasets and creates their price stores before starting the workers, so that runs
+        sharing a symbol and a time window do not download or parse the same file concurrently.
+    """
+    import pricestore
+
+    symbolDataFilePaths = []
+    missingDatasets = []
+    for run in runs:
+        symbolDataFilePath = getDatasetFilePath(run)
+        if symbolDataFilePath in symbolDataFilePaths:
+            continue
+        symbolDataFilePaths.append(symbolDataFilePath)
+        if not util.fileExists(symbolDataFilePath):
+            missingDatasets.append((symbolDataFilePath, run['symbol'], run['startDate'], run['endDate']))
+
+    # the missing datasets are downloaded all together
+    if missingDatasets:
+        util.logger.info(f"Downloading {len(missingDatasets)} datasets ...")
+    errors = util.downloadSymbolsData(missingDatasets) if missingDatasets else {}
+
+    for symbolDataFilePath in symbolDataFilePaths:
+        try:
+            if symbolDataFilePath in errors:
+                raise errors[symbolDataFilePath]
+            if not pricestore.isStoreUpToDate(symbolDataFilePath):
+                pricestore.createStore(symbolDataFilePath)
+        except Exception as e:
+            util.logger.error(f"Error preparing {symbolDataFilePath}: {e}")
+
+
+def runBatch(runs, workers=1, recordResults=True) -> list:
+    prepareDatasets(runs)
+
+    summaries = []
+    if workers <= 1:
+        for runId, run in enumerate(runs):
+            summaries.append(executeRun(runId, run, recordResults))
+            util.logger.info(f"Run {runId + 1}/{len(runs)}: {summaries[-1]['Status']}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(util.ch.level,)) as executor:
+            futures = [executor.submit(executeRun, runId, run, recordResults) for runId, run in enumerate(runs)]
+            for i, future in enumerate(as_completed(futures)):
+                summaries.append(future.result())
+                util.logger.info(f"Run {i + 1}/{len(runs)}: {summaries[-1]['Status']}")
+
+    summaries.sort(key=lambda s: s['Id'])
+    return summaries
+
+
+def initWorker(consoleLevel):
+    util.ch.setLevel(consoleLevel)
+
+
+def serializeRun(run) -> dict:
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in run.items()}
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Run the simulations listed in a JSON or TOML manifest without any user interaction.")
+    parser.add_argument('manifest', help="path of the .json or .toml manifest")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument('-s', '--summary', default=None, help="path of the JSON summary (default: stdout)")
+    parser.add_argument('--summary-only', action='store_true', help="compute only the summary of each run, without storing the per-minute results")
+    parser.add_argument('-r', '--render', choices=('skip', 'after', 'defer'), default='skip',
+                        help="figures: skip them, render them after all the runs, or append the results to a queue rendered later with render.py (default: skip)")
+    parser.add_argument('--render-queue', default=render.DEFAULT_QUEUE_FILE, help=f"queue file used by --render defer (default: {render.DEFAULT_QUEUE_FILE})")
+    parser.add_argument('-q', '--quiet', action='store_true', help="log only warnings and errors to the console")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    if args.quiet:
+        util.ch.setLevel(logging.WARNING)
+
+    try:
+        runs = loadManifest(args.manifest)
+    except Exception as e:
+        util.logger.error(f"Error parsing manifest: {e}")
+        return 2
+
+    util.logger.info(f"Loaded {len(runs)} runs from {args.manifest}")
+    summaries = runBatch(runs, args.workers, not args.summary_only)
+
+    resultsFilePaths = [s['ResultsFile'] for s in summaries if 'ResultsFile' in s and s['Status'] != 'failed']
+    if args.summary_only and args.render != 'skip':
+        util.logger.warning("Figures cannot be rendered with --summary-only")
+    if args.render == 'after':
+        errors = render.renderAll(resultsFilePaths, args.workers)
+        for summary in summaries:
+            if summary.get('ResultsFile') in errors:
+                summary['Figures'] = 'failed' if errors[summary['ResultsFile']] else 'rendered'
+    elif args.render == 'defer':
+        render.appendToQueue(resultsFilePaths, args.render_queue)
+        util.logger.info(f"Figures deferred, render them with: python render.py --queue {args.render_queue}")
+
+    output = json.dumps(summaries, indent=2)
+    if args.summary is None:
+        print(output)
+    else:
+        with open(args.summary, 'w') as f:
+            f.write(output)
+        util.logger.info(f"Summary saved in {args.summary}")
+
+    return 1 if any(s['Status'] == 'failed' for s in summaries) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# coding=utf-8
+import asyncio
+import json
+import logging
+import random
+import time
+
+from .client import Client
+from .exceptions import BinanceAPIException, BinanceRequestException
+from .helpers import interval_to_milliseconds
+from .transport import Transport
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger("Log")
+
+
+class RateLimiter(object):
+    """Request weight budget of each minute, for the spot and the futures api, shared by all the requests of the
+    clients using it
+
+    A request waits for the next minute when its weight does not fit in the budget of the current one; the budget
+    is corrected with the used weight reported by Binance, which also counts the requests of other processes from the
+    same IP. max_concurrent limits the requests in flight. A rate limiter is used within one event loop.
+    """
+
+    def __init__(self, spot_weight=6000, futures_weight=2400, usage=0.8, max_concurrent=10):
+        """Initialise the rate limiter
+
+        :param spot_weight: request weight limit of one minute of the spot api
+        :type spot_weight: int
+        :param futures_weight: request weight limit of one minute of the futures api
+        :type futures_weight: int
+        :param usage: fraction of the limits used, the rest is left to other clients
+        :type usage: float
+        :param max_concurrent: maximum number of requests in flight
+        :type max_concurrent: int
+
+        """
+        self.limits = {'spot': int(spot_weight * usage), 'futures': int(futures_weight * usage)}
+        self.max_concurrent = max_concurrent
+        self._semaphore = None
+        # api -> [minute, used weight]
+        self._windows = {}
+
+    @property
+    def semaphore(self):
+        # created on first use, inside the event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def _window(self, api):
+        minute = int(time.time() // 60)
+        window = self._windows.setdefault(api, [minute, 0])
+        if window[0] != minute:
+            window[0] = minute
+            window[1] = 0
+        return window
+
+    async def acquire(self, api, weight):
+        """Waits until the weight of a request fits in the budget of the current minute and takes it
+
+        :param api: 'spot' or 'futures'
+        :type api: str
+        :param weight: weight of the request
+        :type weight: int
+
+        """
+        while True:
+            window = self._window(api)
+            # a request heavier than the whole budget runs alone at the start of a minute
+            if window[1] + weight <= self.limits[api] or window[1] == 0:
+                window[1] += weight
+                return
+            delay = (window[0] + 1) * 60 - time.time()
+            logger.debug("{} weight {} of {} used, waiting {:.1f}s".format(api, window[1], self.limits[api], delay))
+            await asyncio.sleep(max(delay, 0))
+
+    def update(self, api, used_weight):
+        """Corrects the budget of the current minute with the used weight reported by Binance"""
+        window = self._window(api)
+        window[1] = max(window[1], used_weight)
+
+
+class _Response(object):
+    """Body and status of an aiohttp response, read before the connection is released, with the attributes used by
+    the binance exceptions"""
+
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncClient(object):
+    """Asyncio client of the public market data endpoints used to build the datasets, to download many symbols
+    concurrently (requires the aiohttp package)
+
+    Methods take the same parameters and return the same data of the Client methods with the same name. Requests are
+    retried as the Client transport does and wait for the rate limiter, which can be shared by several clients.
+
+    .. code-block:: python
+
+        async def main():
+            async with AsyncClient() as client:
+                klines = await asyncio.gather(*[
+                    client.get_historical_klines(symbol, '1m', start_ts, end_ts) for symbol in symbols])
+
+    """
+
+    API_URL = Client.API_URL
+    FUTURES_URL = Client.FUTURES_URL
+
+    def __init__(self, tld='com', rate_limiter=None, timeout=10, max_retries=5, backoff_factor=0.5, max_backoff=30,
+                 max_retry_after=300):
+        """Initialise the AsyncClient
+
+        :param tld: top level domain of the api
+        :type tld: str
+        :param rate_limiter: optional - rate limiter shared with other clients (default: RateLimiter())
+        :type rate_limiter: RateLimiter
+        :param timeout: requests timeout in seconds
+        :type timeout: float
+        :param max_retries: retries of a request, see binance.transport.Transport
+        :type max_retries: int
+        :param backoff_factor: delay before the first retry, doubled at each retry (with jitter)
+        :type backoff_factor: float
+        :param max_backoff: maximum delay between two retries when the server does not send Retry-After
+        :type max_backoff: float
+        :param max_retry_after: longest Retry-After waited, a longer ban raises at once
+        :type max_retry_after: float
+
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncClient requires the aiohttp package")
+        self.API_URL = self.API_URL.format(tld)
+        self.FUTURES_URL = self.FUTURES_URL.format(tld)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @property
+    def session(self):
+        # created on first use, inside the event loop; the connector keeps one pool of keep-alive connections
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.rate_limiter.max_concurrent)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  headers={'Accept': 'application/json', 'User-Agent': 'binance/python'})
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _backoff(self, retries):
+        delay = min(self.backoff_factor * 2 ** retries, self.max_backoff)
+        return delay * random.uniform(0.5, 1)
+
+    async def _get(self, api, path, weight, params):
+        url = (self.API_URL + '/' + Client.PRIVATE_API_VERSION if api == 'spot'
+               else self.FUTURES_URL + '/' + Client.FUTURES_API_VERSION) + '/' + path
+        # the None values are not sent, as in Client
+        params = {key: str(value) for key, value in params.items() if value is not None}
+
+        retries = 0
+        while True:
+            await self.rate_limiter.acquire(api, weight)
+            try:
+                async with self.rate_limiter.semaphore:
+                    async with self.session.get(url, params=params) as resp:
+                        response = _Response(resp.status, await resp.text(), resp.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # only GET requests here: always safe to retry
+                if retries >= self.max_retries:
+                    raise
+                delay = self._backoff(retries)
+                reason = type(e).__name__
+            else:
+                used_weight = response.headers.get('X-MBX-USED-WEIGHT-1M')
+                if used_weight is not None:
+                    self.rate_limiter.update(api, int(used_weight))
+                if 200 <= response.status_code < 300:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        raise BinanceRequestException('Invalid Response: %s' % response.text)
+                if retries >= self.max_retries:
+                    raise BinanceAPIException(response)
+                if response.status_code in Transport.RATE_LIMIT_STATUS_CODES:
+                    delay = Transport._retry_after(response)
+                    if delay is None:
+                        delay = self._backoff(retries)
+                    elif delay > self.max_retry_after:
+                        raise BinanceAPIException(response)
+                elif response.status_code in Transport.SERVER_ERROR_STATUS_CODES:
+                    delay = self._backoff(retries)
+                else:
+                    raise BinanceAPIException(response)
+                reason = 'status {}'.format(response.status_code)
+
+            retries += 1
+            logger.warning("GET /{} failed ({}), retry {}/{} in {:.1f}s".format(
+                path, reason, retries, self.max_retries, delay))
+            await asyncio.sleep(delay)
+
+    # Market Data Endpoints
+
+    async def get_klines(self, **params):
+        """Kline/candlestick bars for a symbol, see Client.get_klines
+
+        :raises: BinanceRequestException, BinanceAPIException
+
+        """
+        return await self._get('spot', 'klines', 2, params)
+
+    async def get_aggregate_trades(self, **params):
+        """Get compressed, aggregate trades, see Client.get_aggregate_trades
+
+        :raises: BinanceRequestException, BinanceAPIException
+
+        """
+        return await self._get('spot', 'aggTrades', 2, params)
+
+    async def futures_klines(self, **params):
+        """Kline/candlestick bars for a futures symbol, see Client.futures_klines
+
+        :raises: BinanceRequestException, BinanceAPIException
+
+        """
+        limit = int(params.get('limit') or 500)
+        weight = 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+        return await self._get('futures', 'klines', weight, params)
+
+    async def futures_mark_price(self, **params):
+        """Get Mark Price and Funding Rate, see Client.futures_mark_price
+
+        :raises: BinanceRequestException, BinanceAPIException
+
+        """
+        return await self._get('futures', 'premiumIndex', 1 if params.get('symbol') else 10, params)
+
+    async def futures_funding_rate(self, **params):
+        """Get funding rate history, see Client.futures_funding_rate
+
+        :raises: BinanceRequestException, BinanceAPIException
+
+        """
+        return await self._get('futures', 'fundingRate', 1, params)
+
+    async def get_historical_klines(self, symbol, interval, start_ts, end_ts, limit=1000, futures=False):
+        """Get the klines between two timestamps, as Client.get_historical_klines
+
+        The time range is split in windows of limit klines, downloaded concurrently instead of one after the other.
+
+        :param symbol: Name of symbol pair e.g BNBBTC
+        :type symbol: str
+        :param interval: Binance Kline interval
+        :type interval: str
+        :param start_ts: start timestamp in milliseconds
+        :type start_ts: int
+        :param end_ts: end timestamp in milliseconds
+        :type end_ts: int
+        :param limit: klines of each request, max 1000 (1500 for futures)
+        :type limit: int
+        :param futures: if True the futures klines are downloaded
+        :type futures: bool
+
+        :return: list of OHLCV values
+
+        """
+        get_klines = self.futures_klines if futures else self.get_klines
+        window = interval_to_milliseconds(interval) * limit
+        tasks = [
+            asyncio.ensure_future(get_klines(symbol=symbol, interval=interval, limit=limit, startTime=start,
+                                             endTime=min(start + window - 1, end_ts)))
+            for start in range(start_ts, end_ts + 1, window)
+        ]
+        try:
+            pages = await asyncio.gather(*tasks)
+        except BaseException:
+            # a failed page fails the whole download, the other requests are not left running
+            for task in tasks:
+                task.cancel()
+            raise
+        return [kline for page in pages for kline in page]
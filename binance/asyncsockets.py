@@ -0,0 +1,216 @@
+# coding=utf-8
+import asyncio
+import logging
+import threading
+
+from binance.streams import BaseSocketManager
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger("Log")
+
+
+class _Connection(object):
+    """One stream: the reader task puts the decoded messages in a bounded queue, the dispatcher task takes them out
+    in batches and invokes the callback"""
+
+    def __init__(self, url, callback, queue_size):
+        self.url = url
+        self.callback = callback
+        self.queue_size = queue_size
+        self.queue = None  # created on the event loop
+        self.tasks = []
+
+
+class AsyncSocketManager(BaseSocketManager):
+    """Socket manager running every connection as a task of an asyncio event loop, with the same start_*_socket
+    methods of BinanceSocketManager
+
+    Each stream has a bounded queue between the connection and the callback: when the callback falls behind the queue
+    fills up and the connection stops reading, so the backpressure reaches the server through the TCP window instead of
+    growing the memory or dropping messages (the depth streams can not lose a message). The messages waiting in the
+    queue are delivered together, one callback per message or one per batch with batch_callbacks.
+    Callbacks can be functions or coroutine functions and are invoked on the event loop.
+
+    .. code-block:: python
+
+        async def main():
+            manager = AsyncSocketManager(client)
+            for symbol in symbols:
+                manager.start_aggtrade_futures_socket(symbol, callback)
+            await manager.run()  # until manager.close()
+
+    """
+
+    # reconnection delays in seconds, as the Twisted factory
+    INITIAL_DELAY = 0.1
+    MAX_DELAY = 10
+    MAX_RETRIES = 5
+
+    _reconnect_error_payload = {
+        'e': 'error',
+        'm': 'Max reconnect retries reached'
+    }
+
+    def __init__(self, client, user_timeout=BaseSocketManager.DEFAULT_USER_TIMEOUT, queue_size=1000, batch_size=100,
+                 batch_callbacks=False, decoder=None, ws_queue_size=16):
+        """Initialise the AsyncSocketManager
+
+        :param client: Binance API client, only used by the user and margin sockets
+        :type client: binance.Client
+        :param user_timeout: Custom websocket timeout
+        :type user_timeout: int
+        :param queue_size: maximum number of messages waiting for the callback of each stream
+        :type queue_size: int
+        :param batch_size: maximum number of messages delivered together
+        :type batch_size: int
+        :param batch_callbacks: if True callbacks receive a list of messages instead of one message
+        :type batch_callbacks: bool
+        :param decoder: optional function decoding the messages, see BaseSocketManager
+        :type decoder: function
+        :param ws_queue_size: maximum number of received messages buffered by each connection before they are decoded,
+            when it is full the connection stops reading from the socket
+        :type ws_queue_size: int
+
+        """
+        if websockets is None:
+            raise ImportError("AsyncSocketManager requires the websockets package")
+        BaseSocketManager.__init__(self, client, user_timeout, decoder)
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._batch_callbacks = batch_callbacks
+        self._ws_queue_size = ws_queue_size
+        self._loop = None
+        self._loop_thread = None
+        self._closed = None
+        self._tasks = set()
+
+    def _start_socket(self, path, callback, prefix='ws/'):
+        return self._add_connection(path, self.STREAM_URL + prefix + path, callback)
+
+    def _start_futures_socket(self, path, callback, prefix='stream?streams='):
+        return self._add_connection(path, self.FSTREAM_URL + prefix + path, callback)
+
+    def _add_connection(self, path, url, callback):
+        if path in self._conns:
+            return False
+
+        conn = _Connection(url, callback, self._queue_size)
+        self._conns[path] = conn
+        if self._loop is not None:
+            # sockets can be started while running, also from the keepalive timer threads of the account sockets
+            self._call_in_loop(self._start_tasks, path, conn)
+        return path
+
+    def _stop_connection(self, conn_key):
+        if self._loop is not None:
+            self._call_in_loop(self._cancel_tasks, self._conns[conn_key])
+
+    def _call_in_loop(self, func, *args):
+        if threading.get_ident() == self._loop_thread:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _start_tasks(self, conn_key, conn):
+        conn.queue = asyncio.Queue(maxsize=conn.queue_size)
+        conn.tasks = [
+            self._loop.create_task(self._read(conn_key, conn)),
+            self._loop.create_task(self._dispatch(conn_key, conn)),
+        ]
+        for task in conn.tasks:
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _cancel_tasks(self, conn):
+        for task in conn.tasks:
+            task.cancel()
+        conn.tasks = []
+
+    async def _read(self, conn_key, conn):
+        """Receives the messages of a connection, reconnecting as the Twisted factory does"""
+        retries = 0
+        delay = self.INITIAL_DELAY
+        while True:
+            try:
+                # both queues are bounded, a slow callback slows down the reading down to the TCP window
+                async with websockets.connect(conn.url, max_queue=self._ws_queue_size) as ws:
+                    # reset the delay after reconnecting
+                    retries = 0
+                    delay = self.INITIAL_DELAY
+                    async for message in ws:
+                        if isinstance(message, bytes):
+                            continue
+                        try:
+                            payload_obj = self._decoder(message)
+                        except ValueError:
+                            continue
+                        if payload_obj is None:
+                            continue
+                        # waits while the queue is full: the connection is not read meanwhile
+                        await conn.queue.put(payload_obj)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"{conn_key} connection lost: {e!r}")
+
+            retries += 1
+            if retries > self.MAX_RETRIES:
+                await conn.queue.put(self._reconnect_error_payload)
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_DELAY)
+
+    async def _dispatch(self, conn_key, conn):
+        """Delivers the queued messages to the callback, all those already waiting (up to batch_size) at once"""
+        queue = conn.queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self._batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            if self._batch_callbacks:
+                await self._invoke(conn_key, conn.callback, batch)
+            else:
+                for payload_obj in batch:
+                    await self._invoke(conn_key, conn.callback, payload_obj)
+
+    async def _invoke(self, conn_key, callback, arg):
+        # an exception must not stop the dispatcher, the queue would fill up and block the connection for good
+        try:
+            result = callback(arg)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.exception(f"{conn_key} callback failed")
+
+    async def run(self):
+        """Runs the connections until close() is called"""
+        logger.debug("run")
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._closed = asyncio.Event()
+        for conn_key, conn in list(self._conns.items()):
+            self._start_tasks(conn_key, conn)
+        try:
+            await self._closed.wait()
+        finally:
+            for conn in list(self._conns.values()):
+                self._cancel_tasks(conn)
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop = None
+            self._loop_thread = None
+
+    def close(self):
+        """Close all connections and return from run()
+
+        """
+        BaseSocketManager.close(self)
+        if self._loop is not None:
+            self._call_in_loop(self._closed.set)
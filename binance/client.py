@@ -2,11 +2,11 @@
 
 import hashlib
 import hmac
-import requests
 import time
 from operator import itemgetter
 from .helpers import date_to_milliseconds, interval_to_milliseconds
 from .exceptions import BinanceAPIException, BinanceRequestException, BinanceWithdrawException
+from .transport import Transport
 
 
 class Client(object):
@@ -100,7 +100,7 @@ class Client(object):
     MINING_TO_USDT_FUTURE = "MINING_UMFUTURE"
     MINING_TO_FIAT = "MINING_C2C"
 
-    def __init__(self, api_key=None, api_secret=None, requests_params=None, tld='com'):
+    def __init__(self, api_key=None, api_secret=None, requests_params=None, tld='com', transport=None):
         """Binance API Client constructor
 
         :param api_key: Api Key
@@ -109,6 +109,8 @@ class Client(object):
         :type api_secret: str.
         :param requests_params: optional - Dictionary of requests params to use for all calls
         :type requests_params: dict.
+        :param transport: optional - HTTP transport, can be shared by several clients (default: Transport())
+        :type transport: binance.transport.Transport
 
         """
 
@@ -123,24 +125,36 @@ class Client(object):
 
         self.API_KEY = api_key
         self.API_SECRET = api_secret
-        self.session = self._init_session()
+        self._transport = transport
+        self._headers = {'Accept': 'application/json',
+                         'User-Agent': 'binance/python',
+                         'X-MBX-APIKEY': self.API_KEY}
         self._requests_params = requests_params
         self.response = None
-        self.timestamp_offset = 0
 
-        # init DNS and SSL cert
-        self.ping()
-        # calculate timestamp offset between local and binance server
-        res = self.get_server_time()
-        self.timestamp_offset = res['serverTime'] - int(time.time() * 1000)
+        # the timestamp offset between local and binance server is only needed by signed
+        # endpoints, so it is calculated on the first signed request instead of here
+        self.timestamp_offset = None
+
+    @property
+    def transport(self):
+        """HTTP transport, created on first use so that building a client never touches the network"""
+        if self._transport is None:
+            self._transport = Transport()
+        return self._transport
+
+    @property
+    def session(self):
+        return self.transport.session
 
-    def _init_session(self):
+    @session.setter
+    def session(self, session):
+        self.transport.session = session
 
-        session = requests.session()
-        session.headers.update({'Accept': 'application/json',
-                                'User-Agent': 'binance/python',
-                                'X-MBX-APIKEY': self.API_KEY})
-        return session
+    def _sync_timestamp_offset(self):
+        """Calculate the timestamp offset between local and binance server"""
+        res = self.get_server_time()
+        self.timestamp_offset = res['serverTime'] - int(time.time() * 1000)
 
     def _create_api_uri(self, path, signed=True, version=PUBLIC_API_VERSION):
         v = self.PRIVATE_API_VERSION if signed else version
@@ -197,10 +211,7 @@ class Client(object):
 
     def _request(self, method, uri, signed, force_params=False, **kwargs):
 
-        # set default requests timeout
-        kwargs['timeout'] = 10
-
-        # add our global requests params
+        # add our global requests params, they can override the timeout of the transport
         if self._requests_params:
             kwargs.update(self._requests_params)
 
@@ -214,6 +225,27 @@ class Client(object):
                 kwargs.update(kwargs['data']['requests_params'])
                 del(kwargs['data']['requests_params'])
 
+        if signed and self.timestamp_offset is None:
+            self._sync_timestamp_offset()
+
+        headers = dict(self._headers)
+        headers.update(kwargs.pop('headers', None) or {})
+        kwargs['headers'] = headers
+
+        def prepare(request_kwargs):
+            # called before each attempt: a retried signed request gets a fresh timestamp
+            return self._prepare_request(method, signed, force_params, request_kwargs)
+
+        self.response = self.transport.request(method, uri, prepare=prepare, **kwargs)
+        return self._handle_response()
+
+    def _prepare_request(self, method, signed, force_params, kwargs):
+        # copies, the kwargs of the first attempt are prepared again on a retry
+        kwargs = dict(kwargs)
+        data = kwargs.get('data', None)
+        if isinstance(data, dict):
+            kwargs['data'] = data = dict(data)
+
         if signed:
             # generate signature
             kwargs['data']['timestamp'] = int(time.time() * 1000 + self.timestamp_offset)
@@ -233,8 +265,7 @@ class Client(object):
             kwargs['params'] = '&'.join('%s=%s' % (data[0], data[1]) for data in kwargs['data'])
             del(kwargs['data'])
 
-        self.response = getattr(self.session, method)(uri, **kwargs)
-        return self._handle_response()
+        return kwargs
 
     def _request_api(self, method, path, signed=False, version=PUBLIC_API_VERSION, **kwargs):
         uri = self._create_api_uri(path, signed, version)
@@ -1,12 +1,23 @@
 # coding=utf-8
 
+import logging
 from operator import itemgetter
+import threading
 import time
 
+from sortedcontainers import SortedDict
+
 from .websockets import BinanceSocketManager
 
+logger = logging.getLogger("Log")
+
 
 class DepthCache(object):
+    """Order book of a symbol
+
+    Bids and asks are kept sorted by price (float), so an update costs O(log n), the best bid and ask are read in
+    constant time and the top levels are sliced without sorting the whole book.
+    """
 
     def __init__(self, symbol):
         """Initialise the DepthCache
@@ -16,35 +27,62 @@ class DepthCache(object):
 
         """
         self.symbol = symbol
-        self._bids = {}
-        self._asks = {}
+        self._bids = SortedDict()  # price -> quantity, the best bid is the last one
+        self._asks = SortedDict()  # price -> quantity, the best ask is the first one
         self.update_time = None
 
     def add_bid(self, bid):
-        """Add a bid to the cache
+        """Add a bid to the cache, a zero quantity removes the price level
 
-        :param bid:
+        :param bid: [price, quantity] as strings
         :return:
 
         """
-        self._bids[bid[0]] = float(bid[1])
-        if bid[1] == "0.00000000":
-            del self._bids[bid[0]]
+        quantity = float(bid[1])
+        if quantity == 0:
+            self._bids.pop(float(bid[0]), None)
+        else:
+            self._bids[float(bid[0])] = quantity
 
     def add_ask(self, ask):
-        """Add an ask to the cache
+        """Add an ask to the cache, a zero quantity removes the price level
 
-        :param ask:
+        :param ask: [price, quantity] as strings
         :return:
 
         """
-        self._asks[ask[0]] = float(ask[1])
-        if ask[1] == "0.00000000":
-            del self._asks[ask[0]]
+        quantity = float(ask[1])
+        if quantity == 0:
+            self._asks.pop(float(ask[0]), None)
+        else:
+            self._asks[float(ask[0])] = quantity
+
+    def get_best_bid(self):
+        """Get the highest bid
 
-    def get_bids(self):
+        :return: [price, quantity] as floats, None if there are no bids
+
+        """
+        if not self._bids:
+            return None
+        return list(self._bids.peekitem(-1))
+
+    def get_best_ask(self):
+        """Get the lowest ask
+
+        :return: [price, quantity] as floats, None if there are no asks
+
+        """
+        if not self._asks:
+            return None
+        return list(self._asks.peekitem(0))
+
+    def get_bids(self, limit=None):
         """Get the current bids
 
+        :param limit: optional number of price levels, the best ones, default None for all of them
+        :type limit: int
+
         :return: list of bids with price and quantity as floats
 
         .. code-block:: python
@@ -73,11 +111,18 @@ class DepthCache(object):
             ]
 
         """
-        return DepthCache.sort_depth(self._bids, reverse=True)
+        start = 0 if limit is None else max(len(self._bids) - limit, 0)
+        # slicing the views is much faster than iterating the items
+        prices = self._bids.keys()[start:]
+        quantities = self._bids.values()[start:]
+        return [[price, quantity] for price, quantity in zip(reversed(prices), reversed(quantities))]
 
-    def get_asks(self):
+    def get_asks(self, limit=None):
         """Get the current asks
 
+        :param limit: optional number of price levels, the best ones, default None for all of them
+        :type limit: int
+
         :return: list of asks with price and quantity as floats
 
         .. code-block:: python
@@ -106,7 +151,9 @@ class DepthCache(object):
             ]
 
         """
-        return DepthCache.sort_depth(self._asks, reverse=False)
+        prices = self._asks.keys()[:limit]
+        quantities = self._asks.values()[:limit]
+        return [[price, quantity] for price, quantity in zip(prices, quantities)]
 
     @staticmethod
     def sort_depth(vals, reverse=False):
@@ -118,12 +165,23 @@ class DepthCache(object):
 
 
 class DepthCacheManager(object):
+    """Keeps a DepthCache in sync with the depth diff stream of a symbol
+
+    The order book snapshots are fetched by a background worker, so the socket thread is never blocked by a REST
+    request: while a snapshot is being fetched the diffs are buffered and applied once it arrives. On a periodic
+    refresh the current book keeps being updated until the new snapshot replaces it, after a gap in the update ids the
+    book is not valid (ready is cleared and the callback is not invoked) until it is resynced.
+    """
     _default_refresh = 60 * 30  # 30 minutes
+    _max_retry_delay = 30  # seconds between two failed snapshot requests, at most
 
     def __init__(self, client, symbol, callback=None, refresh_interval=_default_refresh, bm=None, limit=500,
                  ws_interval=None):
         """Initialise the DepthCacheManager
 
+        The constructor returns as soon as the socket is started, use wait_ready or the ready event to know when the
+        first snapshot has been loaded.
+
         :param client: Binance API client
         :type client: binance.Client
         :param symbol: Symbol to create depth cache for
@@ -142,51 +200,114 @@ class DepthCacheManager(object):
         self._symbol = symbol
         self._limit = limit
         self._callback = callback
-        self._last_update_id = None
+        self._depth_cache = None
+        self._last_update_id = None  # None while the book is not valid: the messages are only buffered
         self._depth_message_buffer = []
         self._bm = bm
         self._refresh_interval = refresh_interval
+        self._refresh_time = None
         self._conn_key = None
         self._ws_interval = ws_interval
-
+        self._lock = threading.Lock()  # taken by the socket thread and by the resync worker
+        self._resyncing = False  # a resync worker is running, the messages are also buffered for it
+        self._first_message = threading.Event()
+        self._closed = False
+        self.ready = threading.Event()  # set while the depth cache is in sync
+
+        # buffering starts before the socket, the worker waits for the first message to fetch the snapshot
+        self._request_resync()
         self._start_socket()
-        self._init_cache()
 
-    def _init_cache(self):
-        """Initialise the depth cache calling REST endpoint
+    def wait_ready(self, timeout=None):
+        """Wait until the depth cache is in sync
+
+        :param timeout: optional number of seconds, default None to wait forever
+        :return: True if the depth cache is in sync, False on timeout
 
-        :return:
         """
-        self._last_update_id = None
+        return self.ready.wait(timeout)
+
+    def _request_resync(self, invalidate=True):
+        """Starts a resync worker unless one is already running, must be called with the lock held or before the
+        socket receives messages
+
+        :param invalidate: if True the current book is not valid any more, otherwise it keeps being updated until the
+            new snapshot replaces it
+        """
+        if invalidate:
+            self._last_update_id = None
+            self.ready.clear()
+        if self._resyncing:
+            return
+        self._resyncing = True
         self._depth_message_buffer = []
+        worker = threading.Thread(target=self._resync, name='DepthCacheManager-{}'.format(self._symbol))
+        worker.daemon = True
+        worker.start()
+
+    def _resync(self):
+        """Resync worker: fetches snapshots until one of them is applied"""
+        # the snapshot must not be older than the first buffered message
+        while not self._first_message.wait(1):
+            if self._closed:
+                return
+        delay = 1
+        while not self._closed:
+            try:
+                self._init_cache()
+                return
+            except Exception as e:
+                logger.warning("Depth snapshot of {} failed: {!r}, retrying in {} s".format(self._symbol, e, delay))
+                time.sleep(delay)
+                delay = min(delay * 2, self._max_retry_delay)
+
+    def _init_cache(self):
+        """Initialise the depth cache calling REST endpoint, on the resync worker
 
-        res = self._client.get_order_book(symbol=self._symbol, limit=self._limit)
+        :return:
+        """
+        res = self._get_order_book()
 
         # initialise or clear depth cache
-        self._depth_cache = DepthCache(self._symbol)
+        depth_cache = DepthCache(self._symbol)
 
         # process bid and asks from the order book
         for bid in res['bids']:
-            self._depth_cache.add_bid(bid)
+            depth_cache.add_bid(bid)
         for ask in res['asks']:
-            self._depth_cache.add_ask(ask)
+            depth_cache.add_ask(ask)
 
-        # set first update id
-        self._last_update_id = res['lastUpdateId']
+        with self._lock:
+            if self._closed:
+                return
+            self._depth_cache = depth_cache
 
-        # set a time to refresh the depth cache
-        if self._refresh_interval:
-            self._refresh_time = int(time.time()) + self._refresh_interval
+            # set first update id
+            self._last_update_id = res['lastUpdateId']
 
-        # Apply any updates from the websocket
-        for msg in self._depth_message_buffer:
-            self._process_depth_message(msg, buffer=True)
+            # set a time to refresh the depth cache
+            if self._refresh_interval:
+                self._refresh_time = int(time.time()) + self._refresh_interval
 
-        # clear the depth buffer
-        self._depth_message_buffer = []
+            # from now on the messages are processed directly
+            buffer = self._depth_message_buffer
+            self._depth_message_buffer = []
+            self._resyncing = False
+            self.ready.set()
+
+            # Apply any updates from the websocket
+            for msg in buffer:
+                if self._last_update_id is None:
+                    # a gap in the buffer started a new resync, the messages go to its buffer
+                    self._depth_message_buffer.append(msg)
+                else:
+                    self._process_depth_message(msg)
+
+    def _get_order_book(self):
+        return self._client.get_order_book(symbol=self._symbol, limit=self._limit)
 
     def _start_socket(self):
-        """Start the depth cache socket
+        """Start the depth cache socket, without waiting for its messages
 
         :return:
         """
@@ -197,10 +318,6 @@ class DepthCacheManager(object):
         if not self._bm.is_alive():
             self._bm.start()
 
-        # wait for some socket responses
-        while not len(self._depth_message_buffer):
-            time.sleep(1)
-
     def _depth_event(self, msg):
         """Handle a depth event
 
@@ -216,28 +333,33 @@ class DepthCacheManager(object):
             # notify the user by returning a None value
             if self._callback:
                 self._callback(None)
+            return
 
-        if self._last_update_id is None:
-            # Initial depth snapshot fetch not yet performed, buffer messages
-            self._depth_message_buffer.append(msg)
-        else:
-            self._process_depth_message(msg)
+        with self._lock:
+            self._first_message.set()
+            if self._resyncing:
+                # snapshot fetch in progress, buffer messages
+                self._depth_message_buffer.append(msg)
+            if self._last_update_id is not None:
+                self._process_depth_message(msg)
 
-    def _process_depth_message(self, msg, buffer=False):
-        """Process a depth event message.
+    def _process_depth_message(self, msg):
+        """Process a depth event message, with the lock held.
 
         :param msg: Depth event message.
         :return:
 
         """
 
-        if buffer and msg['u'] <= self._last_update_id:
-            # ignore any updates before the initial update id
+        if msg['u'] <= self._last_update_id:
+            # ignore any updates before the current update id
+            return
+        elif msg['U'] > self._last_update_id + 1:
+            # some updates were missed: resync in the background, this message is buffered for the new snapshot
+            logger.debug("Depth cache of {} out of sync, resyncing".format(self._symbol))
+            self._request_resync()
+            self._depth_message_buffer.append(msg)
             return
-        elif msg['U'] != self._last_update_id + 1:
-            # if not buffered check we get sequential updates
-            # otherwise init cache again
-            self._init_cache()
 
         # add any bid or ask values
         for bid in msg['b']:
@@ -254,14 +376,15 @@ class DepthCacheManager(object):
 
         self._last_update_id = msg['u']
 
-        # after processing event see if we need to refresh the depth cache
+        # after processing event see if we need to refresh the depth cache, the current one is kept up to date meanwhile
         if self._refresh_interval and int(time.time()) > self._refresh_time:
-            self._init_cache()
+            self._refresh_time = int(time.time()) + self._refresh_interval
+            self._request_resync(invalidate=False)
 
     def get_depth_cache(self):
         """Get the current depth cache
 
-        :return: DepthCache object
+        :return: DepthCache object, None before the first snapshot is loaded
 
         """
         return self._depth_cache
@@ -271,11 +394,13 @@ class DepthCacheManager(object):
 
         :return:
         """
+        self._closed = True
         self._bm.stop_socket(self._conn_key)
         if close_socket:
             self._bm.close()
         time.sleep(1)
         self._depth_cache = None
+        self.ready.clear()
 
     def get_symbol(self):
         """Get the symbol
@@ -283,3 +408,136 @@ class DepthCacheManager(object):
         :return: symbol
         """
         return self._symbol
+
+
+class _MultiplexedDepthCacheManager(DepthCacheManager):
+    """Depth cache of one symbol of a MultiDepthCacheManager: its messages come from the shared socket"""
+
+    def __init__(self, client, symbol, callback, refresh_interval, limit, snapshot_semaphore):
+        self._snapshot_semaphore = snapshot_semaphore
+        super(_MultiplexedDepthCacheManager, self).__init__(client, symbol, callback, refresh_interval, limit=limit)
+
+    def _get_order_book(self):
+        with self._snapshot_semaphore:
+            return super(_MultiplexedDepthCacheManager, self)._get_order_book()
+
+    def _start_socket(self):
+        pass
+
+    def close(self, close_socket=False):
+        self._closed = True
+        self._depth_cache = None
+        self.ready.clear()
+
+
+class MultiDepthCacheManager(object):
+    """Keeps the depth caches of many symbols over a single multiplexed connection
+
+    The diff messages of all the symbols arrive on one socket and are routed by stream name to the depth cache of their
+    symbol, each one synced as in DepthCacheManager. The snapshot requests of the symbols are limited to
+    max_concurrent_snapshots at a time, so the startup does not burst the REST request weight.
+    """
+
+    def __init__(self, client, symbols, callback=None, refresh_interval=DepthCacheManager._default_refresh, bm=None,
+                 limit=500, ws_interval=None, max_concurrent_snapshots=5):
+        """Initialise the MultiDepthCacheManager
+
+        The constructor returns as soon as the socket is started, use wait_ready to know when all the depth caches
+        are in sync.
+
+        :param client: Binance API client
+        :type client: binance.Client
+        :param symbols: Symbols to create depth caches for
+        :type symbols: list
+        :param callback: Optional function to receive depth cache updates, of any symbol (see DepthCache.symbol)
+        :type callback: function
+        :param refresh_interval: Optional number of seconds between cache refresh, use 0 or None to disable
+        :type refresh_interval: int
+        :param limit: Optional number of orders to get from orderbook
+        :type limit: int
+        :param ws_interval: Optional interval for updates on websocket, default None. If not set, updates happen every second. Must be 0, None (1s) or 100 (100ms).
+        :type ws_interval: int
+        :param max_concurrent_snapshots: Optional number of order book snapshots requested at the same time
+        :type max_concurrent_snapshots: int
+
+        """
+        self._client = client
+        self._callback = callback
+        self._bm = bm
+        self._conn_key = None
+        snapshot_semaphore = threading.BoundedSemaphore(max_concurrent_snapshots)
+
+        self._managers = {}  # stream name -> depth cache manager of the symbol
+        for symbol in symbols:
+            stream = symbol.lower() + '@depth'
+            if ws_interval is not None:
+                stream = '{}@{}ms'.format(stream, ws_interval)
+            self._managers[stream] = _MultiplexedDepthCacheManager(client, symbol, callback, refresh_interval, limit,
+                                                                   snapshot_semaphore)
+        self._symbol_managers = {m.get_symbol(): m for m in self._managers.values()}
+
+        self._start_socket()
+
+    def _start_socket(self):
+        if self._bm is None:
+            self._bm = BinanceSocketManager(self._client)
+
+        self._conn_key = self._bm.start_multiplex_socket(list(self._managers), self._depth_event)
+        if not self._bm.is_alive():
+            self._bm.start()
+
+    def _depth_event(self, msg):
+        """Route a combined stream message to the depth cache of its symbol
+
+        :param msg: {"stream": "<symbol>@depth", "data": <depth diff>}
+        :return:
+
+        """
+        if 'e' in msg and msg['e'] == 'error':
+            self.close()
+            if self._callback:
+                self._callback(None)
+            return
+
+        manager = self._managers.get(msg.get('stream'))
+        if manager is not None:
+            manager._depth_event(msg['data'])
+
+    def wait_ready(self, timeout=None):
+        """Wait until the depth caches of all the symbols are in sync
+
+        :param timeout: optional number of seconds, default None to wait forever
+        :return: True if all the depth caches are in sync, False on timeout
+
+        """
+        end_time = None if timeout is None else time.time() + timeout
+        for manager in self._managers.values():
+            if not manager.wait_ready(None if end_time is None else max(end_time - time.time(), 0)):
+                return False
+        return True
+
+    def get_depth_cache(self, symbol):
+        """Get the current depth cache of a symbol
+
+        :return: DepthCache object, None before its first snapshot is loaded
+
+        """
+        return self._symbol_managers[symbol].get_depth_cache()
+
+    def get_symbols(self):
+        """Get the symbols
+
+        :return: list of symbols
+        """
+        return list(self._symbol_managers)
+
+    def close(self, close_socket=False):
+        """Close the socket and the depth caches of all the symbols
+
+        :return:
+        """
+        self._bm.stop_socket(self._conn_key)
+        if close_socket:
+            self._bm.close()
+        for manager in self._managers.values():
+            manager.close()
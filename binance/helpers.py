@@ -1,8 +1,5 @@
 # coding=utf-8
 
-import dateparser
-import pytz
-
 from datetime import datetime
 
 
@@ -16,6 +13,10 @@ def date_to_milliseconds(date_str):
     :param date_str: date in readable format, i.e. "January 01, 2018", "11 hours ago UTC", "now UTC"
     :type date_str: str
     """
+    # imported here as dateparser is slow to import and only needed for date strings
+    import dateparser
+    import pytz
+
     # get epoch value in UTC
     epoch = datetime.utcfromtimestamp(0).replace(tzinfo=pytz.utc)
     # parse our date string
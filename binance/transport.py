@@ -0,0 +1,201 @@
+# coding=utf-8
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("Log")
+
+
+class Transport(object):
+    """HTTP transport of the Client: a session with a pool of keep-alive connections, retries with exponential backoff
+    and tracking of the request weight and order count reported by Binance
+
+    Requests rejected by the rate limits (429, 418) are retried with every method, waiting as long as the Retry-After
+    header asks. Server errors (5xx) and connection errors are retried only for GET requests: an order sent again
+    after an unknown outcome could be executed twice. Connect timeouts are retried with every method, the request never
+    reached the server.
+
+    A transport can be shared by several clients, they then share the connections and the weight counters.
+    """
+
+    RATE_LIMIT_STATUS_CODES = (418, 429)
+    SERVER_ERROR_STATUS_CODES = (500, 502, 503, 504)
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, timeout=10, max_retries=5, backoff_factor=0.5,
+                 max_backoff=30, max_retry_after=300, weight_limit=None):
+        """Initialise the transport
+
+        :param pool_connections: number of hosts with a connection pool (spot, futures...)
+        :type pool_connections: int
+        :param pool_maxsize: maximum number of keep-alive connections to each host, raise it for concurrent requests
+        :type pool_maxsize: int
+        :param timeout: default requests timeout in seconds
+        :type timeout: float
+        :param max_retries: retries of a request before returning the last response or raising the last error
+        :type max_retries: int
+        :param backoff_factor: delay before the first retry, doubled at each retry (with jitter)
+        :type backoff_factor: float
+        :param max_backoff: maximum delay between two retries when the server does not send Retry-After
+        :type max_backoff: float
+        :param max_retry_after: longest Retry-After waited, a longer ban is returned to the caller at once
+        :type max_retry_after: float
+        :param weight_limit: optional - when the used weight of the current minute reaches it, requests to the same
+            host wait for the next minute instead of running into a 429
+        :type weight_limit: int
+
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.weight_limit = weight_limit
+
+        self.session = requests.Session()
+        # retries are done here, where Retry-After and the request method are known
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        # host -> {header name (lowercase) -> value}, the latest value reported for each interval
+        self._used_weights = {}
+        self._order_counts = {}
+        # host -> time of the response with the latest counters
+        self._updated = {}
+
+    def request(self, method, uri, prepare=None, **kwargs):
+        """Sends a request, retrying it as described in the class, and returns the last response
+
+        :param method: HTTP method, lowercase
+        :type method: str
+        :param uri: request url
+        :type uri: str
+        :param prepare: optional - function called with the request kwargs before each attempt and returning the kwargs
+            to send, e.g. to sign the request with a fresh timestamp
+        :type prepare: function
+
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(uri).netloc
+        retries = 0
+        while True:
+            self._wait_weight(host)
+            try:
+                response = self.session.request(method, uri, **(prepare(kwargs) if prepare else kwargs))
+            except requests.exceptions.ConnectionError as e:
+                # a connect timeout is a ConnectionError too: the request was not sent
+                if retries >= self.max_retries or not (method == 'get' or isinstance(e, requests.exceptions.ConnectTimeout)):
+                    raise
+                delay = self._backoff(retries)
+                reason = type(e).__name__
+            except requests.exceptions.Timeout:
+                if retries >= self.max_retries or method != 'get':
+                    raise
+                delay = self._backoff(retries)
+                reason = 'read timeout'
+            else:
+                self._update_counters(host, response)
+                status_code = response.status_code
+                if retries >= self.max_retries:
+                    return response
+                if status_code in self.RATE_LIMIT_STATUS_CODES:
+                    delay = self._retry_after(response)
+                    if delay is None:
+                        delay = self._backoff(retries)
+                    elif delay > self.max_retry_after:
+                        return response
+                elif status_code in self.SERVER_ERROR_STATUS_CODES and method == 'get':
+                    delay = self._backoff(retries)
+                else:
+                    return response
+                reason = 'status {}'.format(status_code)
+
+            retries += 1
+            logger.warning("{} {} failed ({}), retry {}/{} in {:.1f}s".format(
+                method.upper(), urlsplit(uri).path, reason, retries, self.max_retries, delay))
+            time.sleep(delay)
+
+    def _backoff(self, retries):
+        delay = min(self.backoff_factor * 2 ** retries, self.max_backoff)
+        # jitter, concurrent clients do not retry all together
+        return delay * random.uniform(0.5, 1)
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            # the http date form is not used by Binance
+            return None
+
+    def _update_counters(self, host, response):
+        weights = {}
+        counts = {}
+        for name, value in response.headers.items():
+            name = name.lower()
+            if name.startswith('x-mbx-used-weight-'):
+                weights[name] = int(value)
+            elif name.startswith('x-mbx-order-count-'):
+                counts[name] = int(value)
+        if not weights and not counts:
+            return
+        with self._lock:
+            if weights:
+                self._used_weights[host] = weights
+                self._updated[host] = time.time()
+            if counts:
+                self._order_counts.setdefault(host, {}).update(counts)
+
+    def _wait_weight(self, host):
+        if self.weight_limit is None:
+            return
+        with self._lock:
+            weight = self._used_weights.get(host, {}).get('x-mbx-used-weight-1m', 0)
+            updated = self._updated.get(host, 0)
+        if weight < self.weight_limit:
+            return
+        # the weight of the minute is reset at the start of the next one
+        delay = updated - updated % 60 + 60 - time.time()
+        if delay > 0:
+            logger.info("{}: used weight {} of {}, waiting {:.1f}s".format(host, weight, self.weight_limit, delay))
+            time.sleep(delay)
+
+    def get_used_weight(self, host=None):
+        """Used weight reported by the latest response, by interval
+
+        :param host: optional - host of the api (e.g. fapi.binance.com), all hosts if not given
+        :type host: str
+
+        :returns: {'x-mbx-used-weight-1m': 12}, or {host: {...}} for all hosts
+
+        """
+        with self._lock:
+            if host is not None:
+                return dict(self._used_weights.get(host, {}))
+            return {h: dict(w) for h, w in self._used_weights.items()}
+
+    def get_order_count(self, host=None):
+        """Order count reported by the latest responses, by interval
+
+        :param host: optional - host of the api, all hosts if not given
+        :type host: str
+
+        :returns: {'x-mbx-order-count-10s': 1, 'x-mbx-order-count-1d': 25}, or {host: {...}} for all hosts
+
+        """
+        with self._lock:
+            if host is not None:
+                return dict(self._order_counts.get(host, {}))
+            return {h: dict(c) for h, c in self._order_counts.items()}
+
+    def close(self):
+        self.session.close()
@@ -183,7 +183,9 @@ class BotLong(Bot):
     ##### PRIVATE METHODS
     def _setTakeProfit(self, position):
         super()._setTakeProfit(position)
-        # TODO cancel previous TP
+        # the new take profit closes the whole position, it replaces the previous one (called again on partial fills)
+        for order in [o for o in self.getOpenOrdersCallback() if o.type == 'TP']:
+            self.cancelOrderCallback(order)
         takeProfitPrice = position.entryPrice * (1 + self.TS / 100)
         self.addOrderCallback(takeProfitPrice, -position.size, gridNumber=-1, type='TP')
 
@@ -220,4 +222,14 @@ class BotLong(Bot):
         for openOrder in self.getOpenOrdersCallback():
             ordersToDelete.append(openOrder)
         for order in ordersToDelete:
-            self.cancelOrderCallback(order)
\ No newline at end of file
+            self.cancelOrderCallback(order)
+
+
+BOT_TYPES = {'BOTH': BotBoth, 'LONG': BotLong}
+
+
+def createBot(buySell, symbol, GO, GS, SF, OS, OF, TS, SL):
+    """ Creates the bot implementing the given strategy (value of the BuySell configuration parameter). """
+    if buySell not in BOT_TYPES:
+        raise ValueError(f"{buySell} is not a valid strategy")
+    return BOT_TYPES[buySell](symbol, GO=GO, GS=GS, SF=SF, OS=OS, OF=OF, TS=TS, SL=SL)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import util
+
+
+class ResultsCache:
+    """ Content addressed cache of simulation results.
+        Results (.csv) and summary (.json) of a simulation are stored under the hash of all its inputs, so a lookup is O(1).
+        The index file keeps size and inputs of each cached file, and the least recently used files are evicted when
+        the cache grows beyond its maximum size. Checkpoints are counted and evicted as the other files.
+    """
+    DEFAULT_FOLDER = 'datasets/cache/'
+    DEFAULT_MAX_SIZE = 2 * 2**30 # bytes
+    LOCK_TIMEOUT = 30 # seconds after which a lock file is considered stale
+
+    def __init__(self, folder=DEFAULT_FOLDER, maxSize=DEFAULT_MAX_SIZE):
+        self.folder = Path(folder)
+        self.maxSize = maxSize
+        self.indexFilePath = self.folder / 'index.json'
+        self.lockFilePath = self.folder / 'index.lock'
+
+
+    ##### PUBLIC METHODS
+    @staticmethod
+    def computeKey(inputs) -> str:
+        """ Returns the hash of a dictionary of simulation inputs. """
+        serializedInputs = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(serializedInputs.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """ Returns the path of the cached results file, None if the key is not cached.
+            The file path is derived from the key, so a lookup costs a single stat and never parses the index.
+        """
+        filePath = self._getFilePath(key, '.csv')
+        if not self._touch(filePath):
+            return None
+        return str(filePath)
+
+    def getSummary(self, key):
+        """ Returns the cached summary of a simulation as a dictionary, None if the key is not cached. """
+        filePath = self._getFilePath(key, '.json')
+        if not self._touch(filePath):
+            return None
+        with open(filePath) as f:
+            return json.load(f)
+
+    def put(self, key, sourceFilePath, inputs=None) -> str:
+        """ Copies a results file in the cache under the given key and returns the cached file path. """
+        filePath = self._getFilePath(key, '.csv')
+        filePath.parent.mkdir(parents=True, exist_ok=True)
+        tmpFilePath = filePath.with_suffix(f'.{os.getpid()}.tmp')
+        shutil.copyfile(sourceFilePath, tmpFilePath)
+        os.replace(tmpFilePath, filePath)
+        self._addToIndex(filePath, inputs)
+        return str(filePath)
+
+    def putSummary(self, key, summary, inputs=None):
+        """ Stores the summary of a simulation, available also for the simulations that do not record their results. """
+        filePath = self._getFilePath(key, '.json')
+        filePath.parent.mkdir(parents=True, exist_ok=True)
+        tmpFilePath = filePath.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmpFilePath, 'w') as f:
+            json.dump(summary, f, default=float)
+        os.replace(tmpFilePath, filePath)
+        self._addToIndex(filePath, inputs)
+
+    def putCheckpoint(self, key, endTimestamp, checkpoint, inputs=None):
+        """ Stores the state of a simulation at endTimestamp. The key identifies the simulation regardless of its end date. """
+        folder = self.folder / 'checkpoints' / key
+        folder.mkdir(parents=True, exist_ok=True)
+        filePath = folder / f'{int(endTimestamp)}.pkl'
+        tmpFilePath = filePath.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmpFilePath, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpFilePath, filePath)
+        self._addToIndex(filePath, inputs)
+
+    def getCheckpoint(self, key, maxEndTimestamp):
+        """ Returns the most recent checkpoint not after maxEndTimestamp, None if there is none. """
+        folder = self.folder / 'checkpoints' / key
+        if not folder.is_dir():
+            return None
+        endTimestamps = [int(p.stem) for p in folder.glob('*.pkl') if int(p.stem) <= maxEndTimestamp]
+        if not endTimestamps:
+            return None
+        filePath = folder / f'{max(endTimestamps)}.pkl'
+        if not self._touch(filePath):
+            return None # evicted meanwhile
+        with open(filePath, 'rb') as f:
+            return pickle.load(f)
+
+    def getSize(self) -> int:
+        return self._loadIndex()['TotalSize']
+
+
+    ##### PRIVATE METHODS
+    def _touch(self, filePath) -> bool:
+        """ Marks a cached file as used, returns False if it does not exist.
+            The modification time of a cached file is its last access time, used for the LRU eviction.
+        """
+        try:
+            os.utime(filePath)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _addToIndex(self, filePath, inputs):
+        relativeFilePath = str(filePath.relative_to(self.folder))
+        with self._lock():
+            index = self._loadIndex()
+            if relativeFilePath in index['Entries']:
+                index['TotalSize'] -= index['Entries'][relativeFilePath]['Size']
+            size = filePath.stat().st_size
+            index['Entries'][relativeFilePath] = {'Size': size, 'Inputs': inputs}
+            index['TotalSize'] += size
+            self._evict(index, keep=relativeFilePath)
+            self._saveIndex(index)
+
+    def _evict(self, index, keep=None):
+        """ Removes the least recently used results until the cache fits its maximum size. """
+        if index['TotalSize'] <= self.maxSize:
+            return
+
+        lastAccessDict = {}
+        for relativeFilePath in index['Entries']:
+            try:
+                lastAccessDict[relativeFilePath] = (self.folder / relativeFilePath).stat().st_mtime
+            except FileNotFoundError:
+                lastAccessDict[relativeFilePath] = 0 # removed by hand, drop the stale entry first
+
+        for relativeFilePath in sorted(lastAccessDict, key=lastAccessDict.get):
+            if index['TotalSize'] <= self.maxSize:
+                break
+            if relativeFilePath == keep:
+                continue
+            filePath = self.folder / relativeFilePath
+            if filePath.is_file():
+                filePath.unlink()
+            index['TotalSize'] -= index['Entries'][relativeFilePath]['Size']
+            del index['Entries'][relativeFilePath]
+            util.logger.debug(f"Evicted cached file {relativeFilePath}")
+
+    def _getFilePath(self, key, extension) -> Path:
+        # files are spread over 256 sub folders to keep directories small with thousands of cached runs
+        return self.folder / key[:2] / f'{key}{extension}'
+
+    def _loadIndex(self) -> dict:
+        if not self.indexFilePath.is_file():
+            return {'TotalSize': 0, 'Entries': {}}
+        with open(self.indexFilePath) as f:
+            return json.load(f)
+
+    def _saveIndex(self, index):
+        # write to a temporary file and rename, so that a reader never sees a partially written index
+        tmpFilePath = self.indexFilePath.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmpFilePath, 'w') as f:
+            json.dump(index, f, default=str)
+        os.replace(tmpFilePath, self.indexFilePath)
+
+    @contextmanager
+    def _lock(self):
+        """ Inter-process lock on the index file, needed when the batch runner uses several workers. """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        startTime = time.time()
+        while True:
+            try:
+                fd = os.open(self.lockFilePath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - self.lockFilePath.stat().st_mtime > self.LOCK_TIMEOUT:
+                        self.lockFilePath.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() - startTime > self.LOCK_TIMEOUT:
+                    raise TimeoutError(f"Could not lock the results cache index: {self.indexFilePath}")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            self.lockFilePath.unlink()
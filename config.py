@@ -21,4 +21,10 @@ SF = None
 OS = None
 OF = None
 TS = None
-SL = None
\ No newline at end of file
+SL = None
+
+# profiling: OFF, TIME (wall time of each phase), FULL (TIME + allocations of each phase + cProfile of the market engine)
+PROFILE = 'OFF'
+
+# create and show the plots at the end of the simulation
+PLOT = True
\ No newline at end of file
@@ -0,0 +1,198 @@
+""" Order book aware fills.
+    By default the market engine fills every order entirely at its price as soon as the mark price crosses it. The depth
+    fill model consults order book snapshots recorded with marketlog.py instead:
+    - grid orders are filled only up to the liquidity on the other side of the book within reach of their price, the
+      rest stays open and is filled on the next ticks;
+    - market and stop loss orders walk the book and are filled at the volume weighted average price;
+    - take profits are filled entirely at their price (a partially closed position is not simulated).
+    Snapshots are stored as distances from the mid price, so the book is moved to the current mark price: a snapshot
+    describes the shape of the book (spread and depth), even if the mark price has moved since it was taken.
+
+    Usage: python fillmodel.py build market.log depth.npz --symbol LTCUSDT [--interval 60] [--levels 50]
+
+    In a batch manifest the keys depthSnapshots (path of the .npz file) and fillParticipation (fraction of the visible
+    liquidity an order can take, default 1) enable the model.
+"""
+import argparse
+import json
+import sys
+from functools import lru_cache
+import numpy as np
+
+import util
+from binance.depthcache import DepthCache
+from marketlog import MarketLogReader, SNAPSHOT_STREAM
+
+
+class DepthSnapshots:
+    """ Order book snapshots in compact arrays, one row per snapshot and one column per price level.
+        For each side: distance of the levels from the mid price, cumulative quantity and cumulative distance * quantity.
+        Sides with fewer levels repeat their last level with zero quantity.
+    """
+    SIDES = ('bid', 'ask')
+
+    def __init__(self, timestamps, arrays):
+        self.timestamps = timestamps # seconds, increasing
+        self.arrays = arrays # '<side>Distances', '<side>CumQuantities', '<side>CumNotionals' -> float32[snapshots, levels]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def getIndex(self, timestamp) -> int:
+        """ Row of the last snapshot taken at or before timestamp, the first one for earlier timestamps. """
+        return max(int(self.timestamps.searchsorted(timestamp, side='right')) - 1, 0)
+
+    def getSide(self, index, side):
+        """ Returns distances, cumulative quantities and cumulative notionals of one side of a snapshot. """
+        return self.arrays[side + 'Distances'][index], self.arrays[side + 'CumQuantities'][index], self.arrays[side + 'CumNotionals'][index]
+
+    def save(self, filePath):
+        np.savez(filePath, timestamps=self.timestamps, **self.arrays)
+
+    @staticmethod
+    def load(filePath):
+        with np.load(filePath) as data:
+            return DepthSnapshots(data['timestamps'], {k: data[k] for k in data.files if k != 'timestamps'})
+
+    @staticmethod
+    def fromBooks(timestamps, books, levels):
+        """ Builds the arrays from a list of (bids, asks), both lists of [price, quantity] starting from the best one. """
+        arrays = {}
+        for sideIndex, side in enumerate(DepthSnapshots.SIDES):
+            distances = np.zeros((len(books), levels), dtype=np.float32)
+            quantities = np.zeros((len(books), levels), dtype=np.float64)
+            for row, book in enumerate(books):
+                mid = (book[0][0][0] + book[1][0][0]) / 2
+                sideLevels = book[sideIndex][:levels]
+                n = len(sideLevels)
+                distances[row, :n] = [abs(price - mid) for price, _ in sideLevels]
+                distances[row, n:] = distances[row, n - 1]
+                quantities[row, :n] = [quantity for _, quantity in sideLevels]
+            arrays[side + 'Distances'] = distances
+            arrays[side + 'CumQuantities'] = np.cumsum(quantities, axis=1).astype(np.float32)
+            arrays[side + 'CumNotionals'] = np.cumsum(quantities * distances, axis=1).astype(np.float32)
+        return DepthSnapshots(np.asarray(timestamps, dtype=np.int64), arrays)
+
+    @staticmethod
+    def fromMarketLog(logFilePath, symbol, interval=60, levels=50):
+        """ Rebuilds the order book of symbol from the depth snapshots and diffs of a market log and samples its best
+            levels every interval seconds. After a missed diff the book is wrong until the next recorded snapshot.
+        """
+        symbol = symbol.lower()
+        snapshotStream = SNAPSHOT_STREAM.format(symbol)
+        depthStream = symbol + '@depth'
+        depthCache = None
+        lastUpdateId = None
+        nextSample = None
+        timestamps = []
+        books = []
+        for timestamp, stream, message in MarketLogReader(logFilePath).read():
+            if stream == snapshotStream:
+                snapshot = json.loads(message)
+                depthCache = DepthCache(symbol.upper())
+                for bid in snapshot['bids']:
+                    depthCache.add_bid(bid)
+                for ask in snapshot['asks']:
+                    depthCache.add_ask(ask)
+                lastUpdateId = snapshot['lastUpdateId']
+            elif stream.startswith(depthStream) and depthCache is not None:
+                data = json.loads(message)
+                data = data.get('data', data)
+                if data['u'] <= lastUpdateId:
+                    continue
+                for bid in data['b']:
+                    depthCache.add_bid(bid)
+                for ask in data['a']:
+                    depthCache.add_ask(ask)
+                lastUpdateId = data['u']
+            else:
+                continue
+
+            if nextSample is None or timestamp >= nextSample:
+                bids = depthCache.get_bids(levels)
+                asks = depthCache.get_asks(levels)
+                if bids and asks:
+                    timestamps.append(timestamp // 1000)
+                    books.append((bids, asks))
+                nextSample = (timestamp // (interval * 1000) + 1) * interval * 1000
+
+        if not books:
+            raise ValueError(f"No order book of {symbol.upper()} in {logFilePath}")
+        return DepthSnapshots.fromBooks(timestamps, books, levels)
+
+
+@lru_cache(maxsize=4)
+def loadDepthSnapshots(filePath) -> DepthSnapshots:
+    """ Loads the snapshots once per process, the runs of a batch share them. """
+    return DepthSnapshots.load(filePath)
+
+
+class DepthFillModel:
+    """ Fills of the orders triggered by the market engine, see the module description.
+        participation is the fraction of the visible liquidity a grid order can take on a tick.
+    """
+    def __init__(self, snapshots, participation=1.0, name=None):
+        self.snapshots = snapshots
+        self.participation = participation
+        self.name = name # identifies the snapshots in the results cache key
+
+    def __str__(self):
+        return f"DepthFillModel({self.name}, participation={self.participation})"
+
+    def getFill(self, order, timestamp, markPrice):
+        """ Returns (size, price) of the part of order filled at this tick, size 0 if nothing is filled. """
+        if order.type == 'TP':
+            return order.size, order.price
+
+        index = self.snapshots.getIndex(timestamp)
+        # a buy order takes the asks, a sell order the bids
+        distances, cumQuantities, cumNotionals = self.snapshots.getSide(index, 'ask' if order.size > 0 else 'bid')
+        direction = 1 if order.size > 0 else -1
+        size = abs(order.size)
+
+        if order.market or order.type == 'SL':
+            level = int(cumQuantities.searchsorted(size))
+            if level >= len(cumQuantities):
+                # deeper than the snapshot: the rest is filled at the last level
+                notional = cumNotionals[-1] + (size - cumQuantities[-1]) * distances[-1]
+            elif level > 0:
+                notional = cumNotionals[level - 1] + (size - cumQuantities[level - 1]) * distances[level]
+            else:
+                notional = size * distances[0]
+            return order.size, markPrice + direction * float(notional) / size
+
+        # limit order crossed by the mark price: the levels between the best one and the order price can be taken
+        reach = abs(order.price - markPrice)
+        level = int(distances.searchsorted(distances[0] + reach, side='right'))
+        available = float(cumQuantities[level - 1]) * self.participation
+        return direction * min(size, available), order.price
+
+
+def createFillModel(depthSnapshotsFilePath, participation=None) -> DepthFillModel:
+    participation = 1.0 if participation is None else float(participation)
+    name = util.fingerprintFile(depthSnapshotsFilePath)
+    return DepthFillModel(loadDepthSnapshots(depthSnapshotsFilePath), participation, name)
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Build the order book snapshots of the depth fill model from a market log.")
+    parser.add_argument('command', choices=('build',))
+    parser.add_argument('log', help="path of the market log, recorded with the depth stream")
+    parser.add_argument('output', help="path of the snapshots file (.npz)")
+    parser.add_argument('--symbol', default='LTCUSDT', help="symbol of the order book (default: LTCUSDT)")
+    parser.add_argument('--interval', type=int, default=60, help="seconds between two snapshots (default: 60)")
+    parser.add_argument('--levels', type=int, default=50, help="price levels stored for each side (default: 50)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    snapshots = DepthSnapshots.fromMarketLog(args.log, args.symbol, args.interval, args.levels)
+    snapshots.save(args.output)
+    util.logger.info(f"{len(snapshots)} snapshots of {args.levels} levels saved in {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
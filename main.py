@@ -1,10 +1,9 @@
-import matplotlib.pyplot as plt
 from simulator import Simulator
 import util
 import config
 import bots
 import time
-import analysis
+from profiling import Profiler
 
 
 # v1.0.0
@@ -14,7 +13,11 @@ import analysis
 
 
 def main():
-    if util.loadConfigFile():
+    profiler = Profiler()
+    with profiler.phase('config load'):
+        configLoaded = util.loadConfigFile()
+
+    if configLoaded:
         info = "\nLoaded configuration:"
         info += f"\nSymbol: {config.SYMBOL}"
         info += f"\nInitial Equity: {config.INITIAL_EQUITY}"
@@ -25,21 +28,34 @@ def main():
         util.logger.info(info)
     else:
         return
+    profiler.setMode(config.PROFILE)
 
-    if config.BUY_SELL == 'BOTH':
-        bot = bots.BotBoth(config.SYMBOL, GO=config.GO, GS=config.GS, SF=config.SF, OS=config.OS, OF=config.OF, TS = config.TS, SL=config.SL)
-    elif config.BUY_SELL == 'LONG':
-        bot = bots.BotLong(config.SYMBOL, GO=config.GO, GS=config.GS, SF=config.SF, OS=config.OS, OF=config.OF, TS = config.TS, SL=config.SL)
-    else:
-        util.logger.error(f"{config.BUY_SELL} is not a valid strategy")
+    try:
+        bot = bots.createBot(config.BUY_SELL, config.SYMBOL, GO=config.GO, GS=config.GS, SF=config.SF, OS=config.OS, OF=config.OF, TS=config.TS, SL=config.SL)
+    except ValueError as e:
+        util.logger.error(e)
         return
 
-    simulator = Simulator(config.INITIAL_EQUITY, config.START_DATE, config.END_DATE, bot)
+    simulator = Simulator(config.INITIAL_EQUITY, config.START_DATE, config.END_DATE, bot, profiler)
     simulator.startSimulation()
 
-    analysis.plotMetrics(simulator.results, str(simulator.bot), simulator.mainDataFolder + f'{simulator.bot}.png')
-    analysis.plotDistributions(simulator.results, simulator.mainDataFolder + f'{simulator.bot}_distr.png')
-    plt.show()
+    if config.PLOT:
+        # plotting libraries are imported only when needed to keep the startup fast
+        import matplotlib.pyplot as plt
+        import analysis
+
+        with profiler.phase('plot metrics'):
+            analysis.plotMetrics(simulator.results, str(simulator.bot), simulator.mainDataFolder + f'{simulator.bot}.png')
+        with profiler.phase('plot distributions'):
+            analysis.plotDistributions(simulator.results, simulator.mainDataFolder + f'{simulator.bot}_distr.png')
+
+    if profiler.enabled:
+        util.logger.info(f"Profiling report:\n{profiler.report()}")
+        profiler.saveReport(simulator.mainDataFolder + f'{simulator.bot}_profile.txt')
+        profiler.saveEngineStats(simulator.mainDataFolder + f'{simulator.bot}_engine.prof')
+
+    if config.PLOT:
+        plt.show()
 
 
 
@@ -1,7 +1,10 @@
+from functools import partial
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import config
 import util
+from metrics import PerformanceSummary
 
 
 class Order:
@@ -17,7 +20,11 @@ class Order:
         self.gridNumber = gridNumber
         self.type = type # Type: '' = normal, 'TP' = take profit, 'SL' = stop loss.
         self.market = market
-        self.fee = MarketEngine.ORDER_FEE_PERCENTAGE/100 * self.price * abs(self.size) # fee associated to the order
+        self.updateFee()
+
+    def updateFee(self):
+        """ Fee associated to the order, to be updated whenever price or size change. """
+        self.fee = MarketEngine.ORDER_FEE_PERCENTAGE/100 * self.price * abs(self.size)
 
     def __str__(self):
         return f"Price: {self.price}, size: {self.size}, gridNumber: {self.gridNumber}, type: {self.type}, market: {self.market}"
@@ -45,64 +52,242 @@ class Position:
         return markPrice * abs(self.size) / config.LEVERAGE * self.getROE(markPrice) / 100
 
 
-class MarketEngine:
-    """ Simulates the behaviour of an exchange.
-        Handles the order executions based on the mark price and updates the open positions each time an order is executed.
+class Account:
+    """ Wallet of the market engine. Several engines sharing one account simulate a portfolio on a single equity pool.
     """
-    ORDER_FEE_PERCENTAGE = 0.02
+    def __init__(self, equity):
+        self.equity = equity
 
-    def __init__(self):
-        self.equity = config.INITIAL_EQUITY
-        self.openOrders = {}
+    def __str__(self):
+        return f"Equity: {self.equity}"
+
+
+class BotLedger:
+    """ Position and open orders of one of the bots trading on a market engine.
+    """
+    def __init__(self, botId):
+        self.botId = botId
         self.position = Position()
+        self.openOrders = {} # the open orders of this bot only, what the bot sees through its callbacks
         self.lastGridReached = None
         self.grossProfit = None
         self.netProfit = None
         self.cumulativeFee = 0
-        self.dictList = []
         self.orderExecutedCallback = None
 
+    def getState(self):
+        return {
+            'openOrders': self.openOrders,
+            'position': self.position,
+            'lastGridReached': self.lastGridReached,
+            'grossProfit': self.grossProfit,
+            'netProfit': self.netProfit,
+            'cumulativeFee': self.cumulativeFee,
+        }
+
+    def setState(self, state):
+        # fill the dictionary in place, the bot keeps a view on it
+        self.openOrders.clear()
+        self.openOrders.update(state['openOrders'])
+        self.position = state['position']
+        self.lastGridReached = state['lastGridReached']
+        self.grossProfit = state['grossProfit']
+        self.netProfit = state['netProfit']
+        self.cumulativeFee = state['cumulativeFee']
+
+
+class AbortConditions:
+    """ Conditions that end a simulation before its end date, typically to skip the rest of hopeless runs in a sweep.
+        Each condition is disabled when None.
+    """
+    def __init__(self, minEquity=None, maxDrawdown=None, liquidation=False, maxStopLosses=None):
+        self.minEquity = minEquity # abort when the equity falls below this value
+        self.maxDrawdown = maxDrawdown # abort when the drawdown of equity plus unrealized PNL exceeds this percentage
+        self.liquidation = liquidation # abort when equity plus unrealized PNL reaches zero
+        self.maxStopLosses = maxStopLosses # abort after this number of stop losses
+
+    def __str__(self):
+        return f"minEquity: {self.minEquity}, maxDrawdown: {self.maxDrawdown}, liquidation: {self.liquidation}, maxStopLosses: {self.maxStopLosses}"
+
+    def isEnabled(self):
+        return self.minEquity is not None or self.maxDrawdown is not None or self.liquidation or self.maxStopLosses is not None
+
+    def check(self, equity, pnl, summary):
+        """ Returns the reason to abort the simulation, None if it can go on. pnl is None without a position. """
+        if self.minEquity is not None and equity < self.minEquity:
+            return f"equity below {self.minEquity}"
+        if self.liquidation and pnl is not None and equity + pnl <= 0:
+            return "liquidation"
+        if self.maxDrawdown is not None and summary.maxValueDrawdown <= -self.maxDrawdown:
+            return f"drawdown beyond {self.maxDrawdown} %"
+        if self.maxStopLosses is not None and summary.stopLosses >= self.maxStopLosses:
+            return f"{summary.stopLosses} stop losses"
+        return None
+
+
+class MarketEngine:
+    """ Simulates the behaviour of an exchange.
+        Handles the order executions based on the mark price and updates the open positions each time an order is executed.
+        Several bots can trade on the same engine: each one has its own position and orders (see BotLedger), while the
+        equity is shared. Executed orders are dispatched to the bot that placed them.
+    """
+    ORDER_FEE_PERCENTAGE = 0.02
+    VERSION = '1.3.0' # part of the results cache key, to be increased whenever a change alters the simulation results
+
+    def __init__(self, recordResults=True, account=None):
+        self.account = account if account is not None else Account(config.INITIAL_EQUITY)
+        self.openOrders = {} # the open orders of all the bots
+        self.orderOwners = {} # order id -> ledger of the bot that placed the order
+        self.ledgers = []
+        self.recordResults = recordResults # if False only the summary is computed, the per-minute results are not stored
+        self.dictList = []
+        self.summary = PerformanceSummary(self.equity)
+        self.abortConditions = None # AbortConditions checked after every tick, None to never abort
+        self.aborted = False
+        self.fillModel = None # decides size and price of the fills (see fillmodel.py), None to fill orders entirely at their price
+
+
+    @property
+    def equity(self):
+        return self.account.equity
+
+    @equity.setter
+    def equity(self, value):
+        self.account.equity = value
+
+    @property
+    def position(self):
+        """ Position of the first bot, the only one in a single bot simulation. """
+        return self.ledgers[0].position
+
 
     ##### PUBLIC METHODS
-    def startSimulation(self, df):
-        nPoints = len(df['Timestamp'])
-        for i in range(1, nPoints):
-            if i % 10000 == 0:
-                util.logger.info(f"{round(i/nPoints*100, 2)} %")
-            self.timestamp = df['Timestamp'][i]
-            self.markPrice = df['Price'][i]
-            ordersToExecute = self._getOrdersToExecute(self.markPrice)
-            if len(ordersToExecute) > 0:
-                # print(datetime.fromtimestamp(self.timestamp))
-                # self.printGrid()
-                for order in ordersToExecute:
-                    util.logger.debug(f"Position before order: {self.position}")
-                    self._executeOrder(order)
-                    util.logger.debug(f"Position after order: {self.position}")
-                    self._addDataframeRow(order)
-            else:
-                self.grossProfit = None
-                self._addDataframeRow()
+    def addBot(self, bot):
+        """ Links a bot with the market through its callbacks. Returns the ledger of the bot. """
+        ledger = BotLedger(len(self.ledgers))
+        self.ledgers.append(ledger)
+        bot.addOrderCallback = partial(self.addOrder, ledger=ledger)
+        bot.cancelOrderCallback = self.cancelOrder
+        bot.getOpenOrdersCallback = ledger.openOrders.values
+        bot.getEquityCallback = self.getEquity
+        ledger.orderExecutedCallback = bot.orderExecutedCallback
+        return ledger
+
+    def startSimulation(self, df, startIndex=1):
+        """ Runs the simulation over the prices in df. The first price is skipped by default as it is used to create the
+            initial grid, a resumed simulation starts from the first price after its checkpoint.
+        """
+        timestamps = np.asarray(df['Timestamp'])
+        prices = np.asarray(df['Price'])
+        nPoints = len(timestamps)
+
+        # convert to python scalars one chunk at a time: much faster than indexing the arrays in the loop, while
+        # memory-mapped prices (see pricestore) are never copied as a whole
+        chunkSize = 10000
+        for chunkStart in range(startIndex, nPoints, chunkSize):
+            chunkEnd = min(chunkStart + chunkSize, nPoints)
+            for timestamp, markPrice in zip(timestamps[chunkStart:chunkEnd].tolist(), prices[chunkStart:chunkEnd].tolist()):
+                self.processTick(timestamp, markPrice)
+                if self.aborted:
+                    break
+            if self.aborted:
+                util.logger.info(f"Simulation aborted at {datetime.fromtimestamp(self.timestamp)}: {self.summary.abortReason}")
+                return
+            util.logger.info(f"{round(chunkEnd/nPoints*100, 2)} %")
 
         util.logger.info("Simulation done")
 
-    def addOrder(self, price, size, gridNumber, type='', market=False):
+    def processTick(self, timestamp, markPrice):
+        """ Executes the orders triggered by a new mark price and updates results and summary. """
+        self.timestamp = timestamp
+        self.markPrice = markPrice
+        ordersToExecute = self._getOrdersToExecute(self.markPrice)
+        # owners are looked up first, the callback of an executed order can cancel the following ones
+        owners = [self.orderOwners[order.id] for order in ordersToExecute]
+        if self.fillModel is not None and len(ordersToExecute) > 0:
+            ordersToExecute, owners = self._applyFillModel(ordersToExecute, owners)
+        if len(ordersToExecute) > 0:
+            # print(datetime.fromtimestamp(self.timestamp))
+            # self.printGrid()
+            for order, ledger in zip(ordersToExecute, owners):
+                util.logger.debug(f"Position before order: {ledger.position}")
+                self._executeOrder(order, ledger)
+                util.logger.debug(f"Position after order: {ledger.position}")
+                self._addDataframeRow(ledger, order)
+        else:
+            for ledger in self.ledgers:
+                ledger.grossProfit = None
+                self._addDataframeRow(ledger)
+
+        pnl = None
+        for ledger in self.ledgers:
+            if ledger.position.entryPrice is not None:
+                pnl = ledger.position.getPNL(self.markPrice) + (pnl or 0)
+        self.summary.updateTick(self.timestamp, self.equity, pnl)
+        if self.abortConditions is not None:
+            abortReason = self.abortConditions.check(self.equity, pnl, self.summary)
+            if abortReason is not None:
+                self.aborted = True
+                self.summary.abortReason = abortReason
+
+    def addOrder(self, price, size, gridNumber, type='', market=False, ledger=None):
+        if ledger is None:
+            ledger = self.ledgers[0]
         order = Order(price, size, gridNumber, type, market)
         self.openOrders[order.id] = order
+        self.orderOwners[order.id] = ledger
+        ledger.openOrders[order.id] = order
 
     def cancelOrder(self, order):
         if order.id in self.openOrders:
             del self.openOrders[order.id]
+            del self.orderOwners[order.id].openOrders[order.id]
+            del self.orderOwners[order.id]
 
     def getOpenOrders(self):
         return self.openOrders.values()
 
-    def cancelAllOrders(self):
-        self.openOrders = {}
+    def cancelAllOrders(self, ledger=None):
+        """ Cancels the open orders of a bot, of all the bots if ledger is None. """
+        for botLedger in (self.ledgers if ledger is None else [ledger]):
+            for orderId in botLedger.openOrders:
+                del self.openOrders[orderId]
+                del self.orderOwners[orderId]
+            botLedger.openOrders.clear() # the bot keeps a view on this dictionary
 
     def getEquity(self):
         return self.equity
 
+    def getSummary(self):
+        """ Performance metrics of the simulation, see metrics.PerformanceSummary. """
+        return self.summary.toDict()
+
+    def getState(self):
+        """ Snapshot of the engine, used to resume a simulation from a checkpoint. """
+        return {
+            'timestamp': self.timestamp,
+            'markPrice': self.markPrice,
+            'equity': self.equity,
+            'ledgers': [ledger.getState() for ledger in self.ledgers],
+            'summary': self.summary,
+            'nextOrderId': Order.staticId,
+        }
+
+    def setState(self, state):
+        """ Restores a snapshot. The bots must have been added already, in the same order. """
+        self.timestamp = state['timestamp']
+        self.markPrice = state['markPrice']
+        self.equity = state['equity']
+        self.openOrders = {}
+        self.orderOwners = {}
+        for ledger, ledgerState in zip(self.ledgers, state['ledgers']):
+            ledger.setState(ledgerState)
+            for order in ledger.openOrders.values():
+                self.openOrders[order.id] = order
+                self.orderOwners[order.id] = ledger
+        self.summary = state['summary']
+        Order.staticId = max(Order.staticId, state['nextOrderId']) # restored orders keep their ids
+
     def getResults(self):
         df = pd.DataFrame(self.dictList) # convert the list of dictionaries in a pandas dataframe
         df['Date'] = [datetime.fromtimestamp(ts) for ts in df['Timestamp']] # add a column with a date format
@@ -111,58 +296,59 @@ class MarketEngine:
 
 
     ##### PRIVATE METHODS
-    def _executeOrder(self, order):
+    def _executeOrder(self, order, ledger):
         util.logger.debug(f"[{datetime.fromtimestamp(self.timestamp)}] Mark price: {self.markPrice}. Execute order: {order}")
-        if self.position.entryPrice is None:
-            self.position = Position(order.price, order.size)
-            self.grossProfit = None
-            self.netProfit = None
-            self.lastGridReached = order.gridNumber
-            self.cumulativeFee += order.fee
+        if ledger.position.entryPrice is None:
+            ledger.position = Position(order.price, order.size)
+            ledger.grossProfit = None
+            ledger.netProfit = None
+            ledger.lastGridReached = order.gridNumber
+            ledger.cumulativeFee += order.fee
         else:
             if order.type=='TP':
-                self._takeProfit(order)
+                self._takeProfit(order, ledger)
             elif order.type=='SL':
-                self._stopLoss(order)
-                self.lastGridReached = order.gridNumber
+                self._stopLoss(order, ledger)
+                ledger.lastGridReached = order.gridNumber
             else:
                 # increase position
-                if self.position.size * order.size <= 0:
+                if ledger.position.size * order.size <= 0:
                     util.logger.error(f"[{datetime.fromtimestamp(self.timestamp)}] Position should be increasing")
-                self.position.update(order)
-                self.grossProfit = None
-                self.netProfit = None
-                self.lastGridReached = order.gridNumber
-                self.cumulativeFee += order.fee
+                ledger.position.update(order)
+                ledger.grossProfit = None
+                ledger.netProfit = None
+                ledger.lastGridReached = order.gridNumber
+                ledger.cumulativeFee += order.fee
 
         self.equity -= order.fee
+        self.summary.updateOrder(order, ledger.lastGridReached, ledger.netProfit if order.type in ('TP', 'SL') else None)
         self.cancelOrder(order)
-        self.orderExecutedCallback(order, self.position)
+        ledger.orderExecutedCallback(order, ledger.position)
 
-    def _takeProfit(self, order):
-        if (self.position.size + order.size) > 0.0001:
+    def _takeProfit(self, order, ledger):
+        if (ledger.position.size + order.size) > 0.0001:
             util.logger.error("Take profit did not reduce position to zero")
-        self.grossProfit = self.position.getPNL(order.price)
-        self.equity += self.grossProfit
-        self.cumulativeFee += order.fee
-        self.netProfit = self.grossProfit - self.cumulativeFee
-        self.cumulativeFee = 0
-        self.position = Position()
-
-    def _stopLoss(self, order):
-        self.grossProfit = self.position.getPNL(order.price)
-        self.equity += self.grossProfit
-        self.cumulativeFee += order.fee
-        self.netProfit = self.grossProfit - self.cumulativeFee
-        self.cumulativeFee = 0
-        self.position = Position()
-        self.cancelAllOrders()
+        ledger.grossProfit = ledger.position.getPNL(order.price)
+        self.equity += ledger.grossProfit
+        ledger.cumulativeFee += order.fee
+        ledger.netProfit = ledger.grossProfit - ledger.cumulativeFee
+        ledger.cumulativeFee = 0
+        ledger.position = Position()
+
+    def _stopLoss(self, order, ledger):
+        ledger.grossProfit = ledger.position.getPNL(order.price)
+        self.equity += ledger.grossProfit
+        ledger.cumulativeFee += order.fee
+        ledger.netProfit = ledger.grossProfit - ledger.cumulativeFee
+        ledger.cumulativeFee = 0
+        ledger.position = Position()
+        self.cancelAllOrders(ledger)
 
     def _getOrdersToExecute(self, markPrice):
         """ Returns a list of order to be executed. """
         ordersToExecute = []
-        takeProfitOrder = None
-        stopLossOrder = None
+        takeProfitOrders = None # ledger -> take profit order, one per bot
+        stopLossOrders = None # ledger -> stop loss order, one per bot
         for order in self.openOrders.values():
             # if market order, execute at mark price
             if order.market:
@@ -173,48 +359,83 @@ class MarketEngine:
             # if limit order, define buy and sell conditions
             if order.type=='SL':
                 if (order.size < 0 and markPrice <= order.price) or (order.size > 0 and markPrice >= order.price):
-                    stopLossOrder = order
+                    if stopLossOrders is None:
+                        stopLossOrders = {}
+                    stopLossOrders[self.orderOwners[order.id]] = order
             else:
                 triggerBuy = order.size > 0 and markPrice <= order.price
                 triggerSell = order.size < 0 and markPrice >= order.price
                 if triggerBuy or triggerSell:
                     if order.type=='TP':
-                        takeProfitOrder = order
+                        if takeProfitOrders is None:
+                            takeProfitOrders = {}
+                        takeProfitOrders[self.orderOwners[order.id]] = order
                     else:
                         ordersToExecute.append(order)
 
-        # make sure that the take profit is executed first to simplify the simulation
-        if takeProfitOrder is not None:
-            return [takeProfitOrder] + ordersToExecute
-
-        # make sure that the stop loss is executed last to simplify the simulation
-        elif stopLossOrder is not None:
-            return ordersToExecute + [stopLossOrder]
-
-        else:
+        if takeProfitOrders is None and stopLossOrders is None:
             return ordersToExecute
 
-    def _addDataframeRow(self, order=None):
-        """ Builds a list of dictionaries with all the relevant data about the simulation. """
-        lastGridReached = self.lastGridReached
+        # make sure that take profits are executed first and stop losses last to simplify the simulation, a bot
+        # taking profit does not execute its stop loss
+        takeProfitOrders = takeProfitOrders or {}
+        stopLossOrders = [o for ledger, o in (stopLossOrders or {}).items() if ledger not in takeProfitOrders]
+        return list(takeProfitOrders.values()) + ordersToExecute + stopLossOrders
+
+    def _applyFillModel(self, orders, owners):
+        """ Replaces the orders to execute with their fills. A partially filled order stays open with the remaining size
+            and is replaced by a new order of the filled size, orders with nothing filled are skipped.
+        """
+        fills = []
+        fillOwners = []
+        for order, ledger in zip(orders, owners):
+            size, price = self.fillModel.getFill(order, self.timestamp, self.markPrice)
+            size = round(size, 3)
+            if size == 0:
+                continue
+            remainingSize = round(order.size - size, 3)
+            if remainingSize == 0:
+                order.price = price
+                order.updateFee()
+                fills.append(order)
+            else:
+                order.size = remainingSize
+                order.updateFee()
+                fills.append(Order(price, size, order.gridNumber, order.type, order.market))
+            fillOwners.append(ledger)
+        return fills, fillOwners
+
+    def _addDataframeRow(self, ledger, order=None):
+        """ Builds a list of dictionaries with all the relevant data about the simulation.
+            With several bots each row refers to the bot in its Bot column.
+        """
+        if not self.recordResults:
+            if ledger.position.entryPrice is not None:
+                self.summary.updateDrawdown(ledger.position.getPNL(self.markPrice) / self.equity * 100)
+            return
+
+        lastGridReached = ledger.lastGridReached
         orderSize = None
         orderPrice = None
         orderFee = None
         grossProfit = None
         netProfit = None
         if order is not None:
-            lastGridReached = abs(self.lastGridReached)
+            lastGridReached = abs(ledger.lastGridReached)
             orderSize = order.size
             orderPrice = order.price
             orderFee = order.fee
-            grossProfit = self.grossProfit
-            netProfit = self.netProfit
+            grossProfit = ledger.grossProfit
+            netProfit = ledger.netProfit
 
+        position = ledger.position
         tmp = dict()
         tmp['Timestamp'] = self.timestamp
+        if len(self.ledgers) > 1:
+            tmp['Bot'] = ledger.botId
         tmp['MarkPrice'] = self.markPrice
-        tmp['PositionSize'] = self.position.size
-        tmp['EntryPrice'] = self.position.entryPrice
+        tmp['PositionSize'] = position.size
+        tmp['EntryPrice'] = position.entryPrice
         tmp['GridReached'] = lastGridReached
         tmp['Equity'] = self.equity
         tmp['OrderSize'] = orderSize
@@ -222,15 +443,16 @@ class MarketEngine:
         tmp['Fee'] = orderFee
         tmp['GrossProfit'] = grossProfit
         tmp['NetProfit'] = netProfit
-        if self.position.entryPrice is not None:
-            tmp['ROE %'] = self.position.getROE(self.markPrice)
-            tmp['PNL'] = self.position.getPNL(self.markPrice)
+        if position.entryPrice is not None:
+            tmp['ROE %'] = position.getROE(self.markPrice)
+            tmp['PNL'] = position.getPNL(self.markPrice)
             tmp['Drawdown %'] = tmp['PNL'] / self.equity * 100
         else:
             tmp['ROE %'] = None
             tmp['PNL'] = None
             tmp['Drawdown %'] = None
 
+        self.summary.updateDrawdown(tmp['Drawdown %'])
         self.dictList.append(tmp)
 
 
@@ -243,4 +465,4 @@ class MarketEngine:
         orderPrices = list(priceToOrderDict.keys())
         orderPrices.sort(reverse=True)
         for p in orderPrices:
-            print(f"----- {priceToOrderDict[p].gridNumber} -> price: {p:.2f}, size: {priceToOrderDict[p].size:.3f}")
\ No newline at end of file
+            print(f"----- {priceToOrderDict[p].gridNumber} -> price: {p:.2f}, size: {priceToOrderDict[p].size:.3f}")
@@ -0,0 +1,323 @@
+""" Record and replay of the market data received from the Binance websockets.
+    A market log is an append-only binary file of zlib compressed blocks of messages, with an index file (.idx) holding
+    first and last timestamp and offset of every block, so a replay can start anywhere without reading the whole log.
+    Each message is stored with its receive timestamp (ms) and the name of its stream (the connection key of the
+    socket manager, e.g. ltcusdt@aggTrade). Order book snapshots are stored as <symbol>@depthSnapshot messages.
+
+    Usage: python marketlog.py record market.log --symbol LTCUSDT --streams aggTrade depth markPrice [--duration s]
+           python marketlog.py info market.log
+
+    The replay socket manager feeds a log to anything written for BinanceSocketManager, e.g. the paper trader
+    (python papertrading.py --replay-log market.log) or a DepthCacheManager together with ReplayClient.
+"""
+import argparse
+import json
+import struct
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+import numpy as np
+
+from binance.websockets import BinanceSocketManager
+import util
+
+
+BLOCK_HEADER = struct.Struct('<IIqq') # compressed size, number of messages, first and last timestamp
+RECORD_HEADER = struct.Struct('<qHI') # timestamp, length of the stream name, length of the message
+INDEX_DTYPE = np.dtype([('FirstTimestamp', '<i8'), ('LastTimestamp', '<i8'), ('Offset', '<i8')])
+SNAPSHOT_STREAM = '{}@depthSnapshot'
+
+
+def getIndexFilePath(logFilePath) -> str:
+    return str(logFilePath) + '.idx'
+
+
+##### WRITER AND READER
+class MarketLogWriter:
+    """ Appends messages to a market log. Messages are buffered and written as one compressed block every
+        blockMessages messages or flushInterval seconds, the index entry of a block is written after the block itself,
+        so the index never points to a partially written block.
+    """
+    def __init__(self, filePath, blockMessages=1000, flushInterval=5, compressionLevel=6):
+        self.filePath = filePath
+        self.blockMessages = blockMessages
+        self.flushInterval = flushInterval
+        self.compressionLevel = compressionLevel
+        self.logFile = open(filePath, 'ab')
+        self.indexFile = open(getIndexFilePath(filePath), 'ab')
+        self.lock = threading.Lock() # messages and snapshots can be written from different threads
+        self.buffer = []
+        self.firstTimestamp = None
+        self.lastTimestamp = None
+        self.lastFlushTime = time.time()
+
+    def write(self, timestamp, stream, message):
+        """ Buffers a message (bytes) received at timestamp (ms) from stream. """
+        streamBytes = stream.encode('utf-8')
+        with self.lock:
+            self.buffer.append(RECORD_HEADER.pack(timestamp, len(streamBytes), len(message)) + streamBytes + message)
+            if self.firstTimestamp is None:
+                self.firstTimestamp = timestamp
+            self.lastTimestamp = timestamp
+            if len(self.buffer) >= self.blockMessages or time.time() - self.lastFlushTime > self.flushInterval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.logFile.close()
+            self.indexFile.close()
+
+    def _flush(self):
+        self.lastFlushTime = time.time()
+        if not self.buffer:
+            return
+        payload = zlib.compress(b''.join(self.buffer), self.compressionLevel)
+        offset = self.logFile.seek(0, 2)
+        self.logFile.write(BLOCK_HEADER.pack(len(payload), len(self.buffer), self.firstTimestamp, self.lastTimestamp) + payload)
+        self.logFile.flush()
+        self.indexFile.write(np.array([(self.firstTimestamp, self.lastTimestamp, offset)], dtype=INDEX_DTYPE).tobytes())
+        self.indexFile.flush()
+        self.buffer = []
+        self.firstTimestamp = None
+        self.lastTimestamp = None
+
+
+class MarketLogReader:
+    """ Reads the messages of a market log in the order they were received. """
+    def __init__(self, filePath):
+        self.filePath = filePath
+
+    def getIndex(self) -> np.ndarray:
+        indexFilePath = getIndexFilePath(self.filePath)
+        if not util.fileExists(indexFilePath):
+            return np.empty(0, dtype=INDEX_DTYPE)
+        data = Path(indexFilePath).read_bytes()
+        return np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+
+    def read(self, startTimestamp=None, endTimestamp=None, streams=None):
+        """ Yields (timestamp, stream, message bytes) of the messages received between startTimestamp and endTimestamp
+            (ms, both optional), only of the given streams if streams is not None.
+        """
+        index = self.getIndex()
+        firstBlock = 0 if startTimestamp is None else int(np.searchsorted(index['LastTimestamp'], startTimestamp))
+        with open(self.filePath, 'rb') as f:
+            for offset in index['Offset'][firstBlock:].tolist():
+                f.seek(offset)
+                size, nMessages, firstTimestamp, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                if endTimestamp is not None and firstTimestamp > endTimestamp:
+                    return
+                payload = zlib.decompress(f.read(size))
+                position = 0
+                for _ in range(nMessages):
+                    timestamp, streamLength, messageLength = RECORD_HEADER.unpack_from(payload, position)
+                    position += RECORD_HEADER.size
+                    stream = payload[position:position + streamLength].decode('utf-8')
+                    position += streamLength
+                    message = payload[position:position + messageLength]
+                    position += messageLength
+                    if startTimestamp is not None and timestamp < startTimestamp:
+                        continue
+                    if endTimestamp is not None and timestamp > endTimestamp:
+                        return
+                    if streams is None or stream in streams:
+                        yield timestamp, stream, message
+
+    def getInfo(self) -> dict:
+        index = self.getIndex()
+        streams = {}
+        for _, stream, _ in self.read():
+            streams[stream] = streams.get(stream, 0) + 1
+        return {
+            'Blocks': len(index),
+            'Size': Path(self.filePath).stat().st_size,
+            'FirstTimestamp': int(index['FirstTimestamp'][0]) if len(index) > 0 else None,
+            'LastTimestamp': int(index['LastTimestamp'][-1]) if len(index) > 0 else None,
+            'Streams': streams,
+        }
+
+
+##### RECORD
+class StreamRecorder:
+    """ Records the messages of socket manager streams in a market log, optionally forwarding them to a callback. """
+    def __init__(self, writer):
+        self.writer = writer
+
+    def attach(self, startSocket, symbol, callback=None, **kwargs):
+        """ Starts a socket with one of the start_*_socket methods of a socket manager and records its messages.
+            Returns the connection key, the name of the stream in the log.
+        """
+        connKey = []
+
+        def recordMessage(message):
+            if connKey:
+                self.writer.write(int(time.time() * 1000), connKey[0], json.dumps(message, separators=(',', ':')).encode('utf-8'))
+            if callback is not None:
+                callback(message)
+
+        key = startSocket(symbol, recordMessage, **kwargs)
+        if key:
+            connKey.append(key)
+        return key
+
+    def recordSnapshot(self, symbol, snapshot):
+        """ Records an order book snapshot (the response of Client.get_order_book), replayed by ReplayClient. """
+        message = json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+        self.writer.write(int(time.time() * 1000), SNAPSHOT_STREAM.format(symbol.lower()), message)
+
+
+##### REPLAY
+class ReplaySocketManager(BinanceSocketManager):
+    """ Socket manager that replays a market log instead of connecting to Binance.
+        The start_*_socket methods are the ones of BinanceSocketManager, so the connection keys match the stream names
+        recorded by StreamRecorder. Messages are delivered on the manager thread at maximum speed (speed None) or at
+        the pace they were received, accelerated by speed.
+    """
+    def __init__(self, logFilePath, speed=None, startTimestamp=None, endTimestamp=None):
+        super().__init__(client=None)
+        self.daemon = True
+        self.reader = MarketLogReader(logFilePath)
+        self.speed = speed
+        self.startTimestamp = startTimestamp
+        self.endTimestamp = endTimestamp
+        self.timestamp = None # receive timestamp (ms) of the last replayed message
+        self.finished = False
+        self._snapshots = {} # symbol -> last replayed order book snapshot
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def _start_socket(self, path, callback, prefix='ws/'):
+        if path in self._conns:
+            return False
+        self._conns[path] = callback
+        return path
+
+    def _start_futures_socket(self, path, callback, prefix='stream?streams='):
+        return self._start_socket(path, callback, prefix)
+
+    def stop_socket(self, conn_key):
+        self._conns.pop(conn_key, None)
+
+    def close(self):
+        self._conns = {}
+        self._stopped = True
+
+    def getSnapshot(self, symbol, wait=True):
+        """ Returns the last replayed order book snapshot of symbol, waiting for the first one if wait is True. """
+        with self._condition:
+            while wait and symbol.lower() not in self._snapshots and not self.finished:
+                self._condition.wait()
+            return self._snapshots.get(symbol.lower())
+
+    def run(self):
+        startTime = time.time()
+        firstTimestamp = None
+        try:
+            for timestamp, stream, message in self.reader.read(self.startTimestamp, self.endTimestamp):
+                if self._stopped:
+                    break
+                if self.speed is not None:
+                    if firstTimestamp is None:
+                        firstTimestamp = timestamp
+                    delay = startTime + (timestamp - firstTimestamp) / 1000 / self.speed - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.timestamp = timestamp
+
+                if stream.endswith('@depthSnapshot'):
+                    with self._condition:
+                        self._snapshots[stream.split('@')[0]] = json.loads(message)
+                        self._condition.notify_all()
+                    continue
+                callback = self._conns.get(stream)
+                if callback is not None:
+                    payload = self._decoder(message)
+                    if payload is not None:
+                        callback(payload)
+        finally:
+            with self._condition:
+                self.finished = True
+                self._condition.notify_all()
+
+
+class ReplayClient:
+    """ Stands in for binance.Client where a replayed component also uses the REST API: get_order_book returns the
+        order book snapshot recorded last before the current position of the replay.
+    """
+    def __init__(self, replaySocketManager):
+        self.replaySocketManager = replaySocketManager
+
+    def get_order_book(self, **params):
+        snapshot = self.replaySocketManager.getSnapshot(params['symbol'])
+        if snapshot is None:
+            raise ValueError(f"No order book snapshot of {params['symbol']} in the market log")
+        return snapshot
+
+
+##### CLI
+RECORD_STREAMS = {
+    'trade': 'start_trade_socket',
+    'aggTrade': 'start_aggtrade_futures_socket',
+    'depth': 'start_depth_socket',
+    'markPrice': 'start_symbol_mark_price_socket',
+    'kline': 'start_kline_socket',
+}
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Record the Binance streams of a symbol in a market log, or show the content of a log.")
+    parser.add_argument('command', choices=('record', 'info'))
+    parser.add_argument('log', help="path of the market log")
+    parser.add_argument('--symbol', default='LTCUSDT', help="symbol to record (default: LTCUSDT)")
+    parser.add_argument('--streams', nargs='+', choices=RECORD_STREAMS, default=['aggTrade', 'markPrice'], help="streams to record (default: aggTrade markPrice)")
+    parser.add_argument('--snapshot-interval', type=float, default=600, help="seconds between two order book snapshots when recording depth (default: 600)")
+    parser.add_argument('--duration', type=float, default=None, help="stop recording after the given number of seconds")
+    return parser.parse_args(argv)
+
+
+def record(args):
+    from twisted.internet import reactor
+    from binance.client import Client
+
+    client = Client()
+    socketManager = BinanceSocketManager(client)
+    writer = MarketLogWriter(args.log)
+    recorder = StreamRecorder(writer)
+    for stream in args.streams:
+        recorder.attach(getattr(socketManager, RECORD_STREAMS[stream]), args.symbol)
+    socketManager.start()
+    util.logger.info(f"Recording {', '.join(args.streams)} of {args.symbol} in {args.log}")
+
+    startTime = time.time()
+    lastSnapshotTime = None
+    try:
+        while args.duration is None or time.time() - startTime < args.duration:
+            if 'depth' in args.streams and (lastSnapshotTime is None or time.time() - lastSnapshotTime > args.snapshot_interval):
+                recorder.recordSnapshot(args.symbol, client.get_order_book(symbol=args.symbol, limit=1000))
+                lastSnapshotTime = time.time()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    reactor.callFromThread(reactor.stop)
+    socketManager.join()
+    writer.close()
+    util.logger.info(f"Recording stopped: {MarketLogReader(args.log).getInfo()}")
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    if args.command == 'record':
+        record(args)
+    else:
+        print(json.dumps(MarketLogReader(args.log).getInfo(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
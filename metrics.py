@@ -0,0 +1,121 @@
+import math
+
+
+class PerformanceSummary:
+    """ Performance metrics of a simulation, maintained as O(1) running accumulators while the market engine runs.
+        They are available without materializing the per-minute results, which sweeps can therefore skip.
+    """
+    SECONDS_PER_YEAR = 365 * 24 * 3600
+
+    def __init__(self, initialEquity):
+        self.initialEquity = initialEquity
+        self.equity = initialEquity
+        self.firstTimestamp = None
+        self.lastTimestamp = None
+        self.nTicks = 0
+        self.nTicksInMarket = 0
+        self.maxDrawdown = None # most negative value of the Drawdown % column: PNL of the open position over equity
+        self.peakValue = initialEquity
+        self.maxValueDrawdown = 0 # peak to trough of equity plus unrealized PNL, in %
+        self.maxGridReached = None
+        self.takeProfits = 0
+        self.stopLosses = 0
+        self.fees = 0
+        self.netProfit = 0
+        self.abortReason = None # why the market engine stopped the simulation before its end date, None if it did not
+
+        # Welford accumulators of the per tick returns of equity plus unrealized PNL
+        self.lastValue = None
+        self.nReturns = 0
+        self.meanReturn = 0
+        self.m2Return = 0
+        self.sumDownsideSquares = 0
+
+
+    ##### UPDATES
+    def updateTick(self, timestamp, equity, pnl):
+        """ Called once per tick, after the orders of the tick have been executed. pnl is None without a position. """
+        if self.firstTimestamp is None:
+            self.firstTimestamp = timestamp
+        self.lastTimestamp = timestamp
+        self.equity = equity
+        self.nTicks += 1
+
+        value = equity
+        if pnl is not None:
+            self.nTicksInMarket += 1
+            value += pnl
+
+        if value > self.peakValue:
+            self.peakValue = value
+        valueDrawdown = (value - self.peakValue) / self.peakValue * 100
+        if valueDrawdown < self.maxValueDrawdown:
+            self.maxValueDrawdown = valueDrawdown
+
+        if self.lastValue is not None and self.lastValue > 0:
+            r = value / self.lastValue - 1
+            self.nReturns += 1
+            delta = r - self.meanReturn
+            self.meanReturn += delta / self.nReturns
+            self.m2Return += delta * (r - self.meanReturn)
+            if r < 0:
+                self.sumDownsideSquares += r * r
+        self.lastValue = value
+
+    def updateDrawdown(self, drawdown):
+        """ Called for every row of the results, with the value of its Drawdown % column. """
+        if drawdown is not None and (self.maxDrawdown is None or drawdown < self.maxDrawdown):
+            self.maxDrawdown = drawdown
+
+    def updateOrder(self, order, lastGridReached, netProfit):
+        """ Called for every executed order. netProfit is the net profit of the closed position, None if still open. """
+        self.fees += order.fee
+        if order.type == 'TP':
+            self.takeProfits += 1
+        elif order.type == 'SL':
+            self.stopLosses += 1
+        if netProfit is not None:
+            self.netProfit += netProfit
+        if lastGridReached is not None and (self.maxGridReached is None or abs(lastGridReached) > self.maxGridReached):
+            self.maxGridReached = abs(lastGridReached)
+
+
+    ##### METRICS
+    def getSharpeRatio(self):
+        """ Annualized mean over standard deviation of the per tick returns, risk free rate assumed zero. """
+        if self.nReturns < 2 or self.m2Return == 0:
+            return None
+        std = math.sqrt(self.m2Return / (self.nReturns - 1))
+        return self.meanReturn / std * math.sqrt(self._getTicksPerYear())
+
+    def getSortinoRatio(self):
+        """ As the Sharpe ratio, with the downside deviation in place of the standard deviation. """
+        if self.nReturns < 2 or self.sumDownsideSquares == 0:
+            return None
+        downsideDeviation = math.sqrt(self.sumDownsideSquares / self.nReturns)
+        return self.meanReturn / downsideDeviation * math.sqrt(self._getTicksPerYear())
+
+    def toDict(self):
+        profit = self.equity - self.initialEquity
+        return {
+            'Profit': profit,
+            'Profit %': profit / self.initialEquity * 100,
+            'MaxDrawdown %': self.maxDrawdown,
+            'MaxEquityDrawdown %': self.maxValueDrawdown,
+            'MaxGridReached': self.maxGridReached,
+            'ClosedPositions': self.takeProfits + self.stopLosses,
+            'TakeProfits': self.takeProfits,
+            'StopLosses': self.stopLosses,
+            'NetProfit': self.netProfit,
+            'Fees': self.fees,
+            'TimeInMarket %': self.nTicksInMarket / self.nTicks * 100 if self.nTicks > 0 else 0,
+            'SharpeRatio': self.getSharpeRatio(),
+            'SortinoRatio': self.getSortinoRatio(),
+            'Aborted': self.abortReason is not None,
+            'AbortReason': self.abortReason,
+        }
+
+    def _getTicksPerYear(self):
+        if self.nTicks < 2 or self.lastTimestamp == self.firstTimestamp:
+            return 0
+        return self.SECONDS_PER_YEAR / ((self.lastTimestamp - self.firstTimestamp) / (self.nTicks - 1))
@@ -0,0 +1,137 @@
+""" Parameter search by successive halving.
+    All the parameter combinations of the grid (or a random sample of them) are simulated on a short window starting at
+    startDate, only the best 1/eta of them are promoted to a window eta times longer, and so on up to endDate.
+    The windows of the rungs share their start, so a promoted configuration resumes from the checkpoint of its previous
+    rung instead of simulating again from the start. Configurations that meet an abort condition (abortEquity,
+    abortDrawdown, abortLiquidation, abortStopLosses, see batch.py) are stopped as soon as it happens and never promoted.
+
+    Usage: python optimizer.py optimizer.json [--workers N]
+
+    Configuration format:
+    {
+        "symbol": "LTCUSDT", "buySell": "LONG", "initialEquity": 1000, "leverage": 20,
+        "startDate": "2021-01-01", "endDate": "2021-07-01",
+        "minDays": 7, "eta": 3, "samples": 200, "seed": 0, "objective": "calmar",
+        "abortDrawdown": 50, "abortLiquidation": true,
+        "grid": {"GO": [5, 7, 9], "GS": [0.2, 0.3, 0.4], "SF": [1.5, 2], "OS": [0.5, 0.8], "OF": [2, 2.2], "TS": [0.3, 0.5], "SL": null}
+    }
+"""
+import argparse
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+import numpy as np
+
+import batch
+import pricestore
+import util
+import walkforward
+
+
+##### SEARCH
+def getRungs(timestamps, startDate, endDate, minDays, eta) -> list:
+    """ Returns the end index into timestamps of the window of each rung, the last rung covering the whole range. """
+    rungEnds = []
+    days = minDays
+    while startDate + timedelta(days=days) < endDate:
+        rungEnds.append(int(np.searchsorted(timestamps, util.toTimestamp(startDate + timedelta(days=days)))))
+        days *= eta
+    rungEnds.append(int(np.searchsorted(timestamps, util.toTimestamp(endDate))))
+    return rungEnds
+
+
+def _evaluateTask(args):
+    datasetFilePath, run, startIndex, endIndex = args
+    try:
+        return walkforward.simulateWindow(datasetFilePath, run, startIndex, endIndex)[0]
+    except Exception as e:
+        util.logger.error(f"Simulation failed: {e}")
+        return None
+
+
+def runSuccessiveHalving(settings, workers=1) -> dict:
+    """ Runs the search. Returns the ranking of the last rung and the number of simulated configurations per rung. """
+    startDate = batch.parseDate(settings['startDate'])
+    endDate = batch.parseDate(settings['endDate'])
+    objective = walkforward.OBJECTIVES[settings.get('objective', 'profit')]
+    eta = settings.get('eta', 3)
+
+    fixedParameters = {k: settings[k] for k in ('symbol', 'buySell', 'initialEquity', 'leverage')}
+    fixedParameters.update({k: settings[k] for k in batch.ABORT_KEYS + batch.FILL_KEYS if k in settings})
+    runs = batch.expandRunEntry({**fixedParameters, **settings['grid'], 'startDate': startDate, 'endDate': endDate})
+    if settings.get('samples') is not None and settings['samples'] < len(runs):
+        runs = random.Random(settings.get('seed')).sample(runs, settings['samples'])
+
+    # download the whole range once, every simulation uses a slice of its price store
+    batch.prepareDatasets(runs[:1])
+    datasetFilePath = batch.getDatasetFilePath(runs[0])
+    timestamps = np.asarray(pricestore.attachStore(datasetFilePath)['Timestamp'])
+    startIndex = int(np.searchsorted(timestamps, util.toTimestamp(startDate)))
+    rungEnds = getRungs(timestamps, startDate, endDate, settings.get('minDays', 7), eta)
+    util.logger.info(f"Successive halving: {len(runs)} configurations, {len(rungEnds)} rungs")
+
+    candidates = runs
+    rungSizes = []
+    with ProcessPoolExecutor(max_workers=max(workers, 1), initializer=batch.initWorker, initargs=(util.ch.level,)) as executor:
+        for rung, endIndex in enumerate(rungEnds):
+            rungSizes.append(len(candidates))
+            tasks = [(datasetFilePath, run, startIndex, endIndex) for run in candidates]
+            summaries = list(executor.map(_evaluateTask, tasks))
+
+            ranking = []
+            for run, summary in zip(candidates, summaries):
+                if summary is None or summary['Aborted']:
+                    continue
+                score = objective(summary)
+                if score is not None and not np.isnan(score):
+                    ranking.append((score, run, summary))
+            ranking.sort(key=lambda r: r[0], reverse=True)
+            util.logger.info(f"Rung {rung + 1}/{len(rungEnds)}: {len(candidates)} simulated, {len(candidates) - len(ranking)} aborted or failed")
+
+            if rung < len(rungEnds) - 1:
+                candidates = [run for _, run, _ in ranking[:max(len(ranking) // eta, 1)]]
+                if not candidates:
+                    break
+
+    return {'Ranking': ranking, 'RungSizes': rungSizes}
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Search the strategy parameters by successive halving.")
+    parser.add_argument('settings', help="path of the optimizer JSON configuration")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument('-o', '--output', default='datasets/optimizer/', help="output folder (default: datasets/optimizer/)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    with open(args.settings) as f:
+        settings = json.load(f)
+
+    output = runSuccessiveHalving(settings, args.workers)
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    reportFilePath = args.output + Path(args.settings).stem + '_report.json'
+    report = {
+        'RungSizes': output['RungSizes'],
+        'Ranking': [{'Objective': score, 'Run': batch.serializeRun(run), 'Summary': summary} for score, run, summary in output['Ranking']],
+    }
+    with open(reportFilePath, 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+
+    if output['Ranking']:
+        score, run, _ = output['Ranking'][0]
+        util.logger.info(f"Best configuration (objective {score:.3f}): {batch.serializeRun(run)}")
+    else:
+        util.logger.warning("Every configuration was aborted or failed")
+    util.logger.info(f"Report saved in {reportFilePath}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+""" Paper trading.
+    Runs a bot live against the market engine, fed by the Binance websocket streams instead of historical prices.
+    Fills are simulated by the market engine exactly as in a backtest and the results are saved in the same format.
+
+    Usage: python papertrading.py [--stream markPrice|aggTrade|kline] [--record messages.jsonl] [--replay messages.jsonl]
+           python papertrading.py --replay-log market.log [--speed x]
+
+    The bot and its parameters are read from the configuration file. With --replay the messages of a recording are
+    served by a local websocket server (see replayserver.py), so the whole pipeline can be tested offline. With
+    --replay-log the streams of a market log (see marketlog.py) are replayed without any connection.
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import bots
+import config
+import util
+from market_engine import MarketEngine
+
+
+STREAMS = ('markPrice', 'aggTrade', 'kline')
+
+
+def parseTick(stream, message):
+    """ Returns (timestamp in seconds, price) of a stream message, None if the message carries no price. """
+    data = message.get('data', message) # the futures streams are combined streams, the payload is under 'data'
+    if stream == 'markPrice':
+        return data['E'] / 1000, float(data['p'])
+    if stream == 'aggTrade':
+        return data['T'] / 1000, float(data['p'])
+    if stream == 'kline':
+        return data['E'] / 1000, float(data['k']['c'])
+    return None
+
+
+class PaperTrader:
+    """ Feeds the ticks of a stream to a market engine with a bot.
+        Messages are handled on the socket manager thread, the engine and the bot are only used there.
+    """
+    def __init__(self, bot, stream='markPrice', recordResults=True, recordFilePath=None):
+        if stream not in STREAMS:
+            raise ValueError(f"Unknown stream: {stream}")
+        self.bot = bot
+        self.stream = stream
+        self.market = MarketEngine(recordResults)
+        ledger = self.market.addBot(bot)
+        self._botOrderExecutedCallback = ledger.orderExecutedCallback
+        ledger.orderExecutedCallback = self._orderExecutedCallback
+        self.recordFile = open(recordFilePath, 'a') if recordFilePath is not None else None
+        self.socketManager = None
+        self.connKey = None
+        self.startDate = None
+        self.nTicks = 0
+        self.nFills = 0
+        self.handlingTime = 0
+        self.maxHandlingTime = 0
+
+    def start(self, socketManager):
+        """ Subscribes to the stream of the bot symbol. The socket manager thread is started by the caller. """
+        self.socketManager = socketManager
+        startSocket = {
+            'markPrice': socketManager.start_symbol_mark_price_socket,
+            'aggTrade': socketManager.start_aggtrade_futures_socket,
+            'kline': socketManager.start_kline_socket,
+        }[self.stream]
+        self.connKey = startSocket(self.bot.symbol, self.processMessage)
+        util.logger.info(f"Paper trading {self.bot} on the {self.stream} stream")
+
+    def stop(self):
+        if self.socketManager is not None and self.connKey:
+            self.socketManager.stop_socket(self.connKey)
+            self.connKey = None
+        if self.recordFile is not None:
+            self.recordFile.close()
+            self.recordFile = None
+
+    def processMessage(self, message):
+        """ Socket callback: the first price creates the initial grid, the following ones are ticks of the engine. """
+        startTime = time.perf_counter()
+        if message.get('e') == 'error':
+            util.logger.error(f"Stream error: {message.get('m')}")
+            return
+
+        tick = parseTick(self.stream, message)
+        if tick is None:
+            return
+        timestamp, markPrice = tick
+        if self.startDate is None:
+            self.startDate = datetime.fromtimestamp(timestamp)
+            self.market.timestamp = timestamp
+            self.market.markPrice = markPrice
+            self.bot.createInitialGrid(startPrice=markPrice)
+        else:
+            self.market.processTick(timestamp, markPrice)
+
+        elapsed = time.perf_counter() - startTime
+        self.nTicks += 1
+        self.handlingTime += elapsed
+        if elapsed > self.maxHandlingTime:
+            self.maxHandlingTime = elapsed
+
+        if self.recordFile is not None:
+            self.recordFile.write(json.dumps(message, separators=(',', ':')) + '\n')
+
+    def getStats(self) -> dict:
+        return {
+            'Ticks': self.nTicks,
+            'Fills': self.nFills,
+            'MeanHandlingTime us': self.handlingTime / self.nTicks * 1e6 if self.nTicks > 0 else None,
+            'MaxHandlingTime us': self.maxHandlingTime * 1e6,
+        }
+
+    def saveResults(self, folder='datasets/papertrading/') -> str:
+        """ Saves the results in the same format of a simulation. Returns the file path, None without results. """
+        if not self.market.dictList:
+            return None
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        filePath = folder + f"{self.bot}_{self.startDate:%Y-%m-%d-%Hh-%Mm}.csv"
+        self.market.getResults().to_csv(filePath)
+        return filePath
+
+    def _orderExecutedCallback(self, order, position):
+        self.nFills += 1
+        util.logger.info(f"[{datetime.fromtimestamp(self.market.timestamp)}] Fill: {order}. Position: {position}")
+        self._botOrderExecutedCallback(order, position)
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Paper trade the configured bot on the live Binance streams.")
+    parser.add_argument('--stream', choices=STREAMS, default='markPrice', help="price stream feeding the market engine (default: markPrice)")
+    parser.add_argument('--record', default=None, help="append the received messages to a JSON lines file")
+    parser.add_argument('--replay', default=None, help="replay the messages of a JSON lines file through a local websocket server")
+    parser.add_argument('--replay-log', default=None, help="replay the streams of a market log recorded with marketlog.py")
+    parser.add_argument('--speed', type=float, default=None, help="pace of --replay-log relative to the recording (default: maximum speed)")
+    parser.add_argument('--duration', type=float, default=None, help="stop after the given number of seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    if not util.loadConfigFile():
+        return 2
+
+    bot = bots.createBot(config.BUY_SELL, config.SYMBOL, GO=config.GO, GS=config.GS, SF=config.SF, OS=config.OS, OF=config.OF, TS=config.TS, SL=config.SL)
+    trader = PaperTrader(bot, args.stream, recordFilePath=args.record)
+
+    if args.replay_log is not None:
+        import marketlog
+        socketManager = marketlog.ReplaySocketManager(args.replay_log, args.speed)
+
+        def stop():
+            trader.stop()
+            socketManager.close()
+    else:
+        from twisted.internet import reactor
+        from binance.client import Client
+        from binance.websockets import BinanceSocketManager
+        socketManager = BinanceSocketManager(Client()) # market streams do not need API keys
+
+        def stopReactor():
+            trader.stop()
+            if reactor.running:
+                reactor.stop()
+
+        def stop():
+            reactor.callFromThread(stopReactor)
+
+        if args.replay is not None:
+            import replayserver
+            url = replayserver.startReplayServer(replayserver.loadRecording(args.replay), finishedCallback=stopReactor)
+            socketManager.STREAM_URL = url
+            socketManager.FSTREAM_URL = url
+
+    trader.start(socketManager)
+    socketManager.start()
+    startTime = time.time()
+    try:
+        while socketManager.is_alive():
+            socketManager.join(1)
+            if args.duration is not None and time.time() - startTime > args.duration:
+                stop()
+    except KeyboardInterrupt:
+        stop()
+        socketManager.join()
+
+    resultsFilePath = trader.saveResults()
+    if resultsFilePath is not None:
+        util.logger.info(f"Results saved in {resultsFilePath}")
+    util.logger.info(f"Paper trading stopped: {trader.getStats()} {trader.market.getSummary()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+""" Multi-symbol portfolio simulation.
+    One bot per symbol, each with its own market engine (order book and position), all sharing a single account: fees
+    and profits of every symbol move the same equity, which every bot uses to size its grids.
+    The price timelines of the symbols are merged by timestamp one block of time at a time, so the memory used does not
+    grow with the length of the simulation.
+
+    Usage: python portfolio.py portfolio.json
+
+    Configuration format (every symbol entry overrides the defaults):
+    {
+        "initialEquity": 1000, "leverage": 20, "startDate": "2021-03-01", "endDate": "2021-04-01",
+        "defaults": {"buySell": "LONG", "GO": 7, "GS": 0.2, "SF": 2, "OS": 0.8, "OF": 2.2, "TS": 0.3, "SL": null},
+        "symbols": ["LTCUSDT", "ETHUSDT", {"symbol": "BTCUSDT", "GS": 0.3}]
+    }
+"""
+import argparse
+import json
+import math
+import sys
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import batch
+import config
+import pricestore
+import util
+from market_engine import Account
+from metrics import PerformanceSummary
+
+
+class Portfolio:
+    """ Runs several bots on different symbols against a shared account.
+        Each symbol keeps its own simulator (bot and market engine), the portfolio routes every tick of the merged
+        timeline to the market engine of its symbol and tracks equity and margin of the whole account.
+        Fills that increase a position are limited to the margin available in the account (see MarginLimit). A symbol
+        whose abort conditions are met stops trading, the whole portfolio stops when the account is liquidated.
+    """
+    BLOCK_SECONDS = 24 * 3600 # length of the blocks of time in which the timelines are merged
+
+    def __init__(self, runs, recordResults=True):
+        self.runs = runs
+        self.recordResults = recordResults
+        self.initialEquity = float(runs[0]['initialEquity'])
+        self.account = Account(self.initialEquity)
+        self.simulators = [batch.createSimulator(run, recordResults, account=self.account) for run in runs]
+        self.marginLimits = []
+        for simulator in self.simulators:
+            marginLimit = MarginLimit(self._getAvailableMargin, simulator.market.fillModel)
+            simulator.market.fillModel = marginLimit
+            self.marginLimits.append(marginLimit)
+        self.mainDataFolder = self.simulators[0].mainDataFolder + 'portfolio/'
+        self.summary = PerformanceSummary(self.initialEquity)
+        self.dictList = []
+        self.results = None
+
+    def startSimulation(self):
+        batch.prepareDatasets(self.runs)
+        symbolDataList = [pricestore.attachStore(s.symbolDataFilePath) for s in self.simulators]
+
+        util.logger.info(f"Portfolio simulation started on {len(self.simulators)} symbols")
+        for simulator, symbolData in zip(self.simulators, symbolDataList):
+            simulator.bot.createInitialGrid(startPrice=symbolData['Price'][0])
+
+        markets = [s.market for s in self.simulators]
+        pnlList = [0.0] * len(markets) # unrealized PNL of each symbol
+        marginList = [0.0] * len(markets) # margin used by the open position of each symbol
+        totalPNL = 0.0
+        totalMargin = 0.0
+
+        startIndices = [1] * len(symbolDataList) # the first price of each symbol is used to create its initial grid
+        firstTimestamp = min(int(d['Timestamp'][1]) for d in symbolDataList if len(d) > 1)
+        lastTimestamp = max(int(d['Timestamp'][-1]) for d in symbolDataList)
+        for blockStart in range(firstTimestamp, lastTimestamp + 1, self.BLOCK_SECONDS):
+            # k-way merge of the block: the stable sort keeps the symbol order among equal timestamps
+            timestampsList, pricesList, symbolIndicesList = [], [], []
+            for i, symbolData in enumerate(symbolDataList):
+                endIndex = int(symbolData['Timestamp'].searchsorted(blockStart + self.BLOCK_SECONDS))
+                if endIndex > startIndices[i]:
+                    timestampsList.append(np.asarray(symbolData['Timestamp'][startIndices[i]:endIndex]))
+                    pricesList.append(np.asarray(symbolData['Price'][startIndices[i]:endIndex]))
+                    symbolIndicesList.append(np.full(endIndex - startIndices[i], i, dtype=np.int32))
+                    startIndices[i] = endIndex
+            if not timestampsList:
+                continue
+            timestamps = np.concatenate(timestampsList)
+            order = np.argsort(timestamps, kind='stable')
+            timestamps = timestamps[order]
+            prices = np.concatenate(pricesList)[order]
+            symbolIndices = np.concatenate(symbolIndicesList)[order]
+            isLastOfTimestamp = np.append(timestamps[1:] != timestamps[:-1], True) # the account is recorded once per timestamp
+
+            for timestamp, markPrice, i, isLast in zip(timestamps.tolist(), prices.tolist(), symbolIndices.tolist(), isLastOfTimestamp.tolist()):
+                market = markets[i]
+                if not market.aborted:
+                    # an aborted symbol keeps its position and orders as they were, its prices are skipped
+                    market.processTick(timestamp, markPrice)
+                    if market.aborted:
+                        util.logger.info(f"{self.simulators[i].bot} aborted at {datetime.fromtimestamp(timestamp)}: {market.summary.abortReason}")
+
+                    pnl, margin = self._getPNLAndMargin(market.position, markPrice)
+                    totalPNL += pnl - pnlList[i]
+                    totalMargin += margin - marginList[i]
+                    pnlList[i] = pnl
+                    marginList[i] = margin
+
+                if isLast:
+                    self._updateAccount(timestamp, totalPNL, totalMargin)
+                    if self.account.equity + totalPNL <= 0:
+                        self.summary.abortReason = "liquidation"
+                    elif all(m.aborted for m in markets):
+                        self.summary.abortReason = "all the symbols aborted"
+                    if self.summary.abortReason is not None:
+                        break
+
+            if self.summary.abortReason is not None:
+                util.logger.info(f"Portfolio simulation aborted at {datetime.fromtimestamp(timestamp)}: {self.summary.abortReason}")
+                break
+            util.logger.info(f"{round(min((blockStart + self.BLOCK_SECONDS - firstTimestamp) / (lastTimestamp + 1 - firstTimestamp), 1) * 100, 2)} %")
+
+        util.logger.info("Portfolio simulation done")
+        if self.recordResults:
+            self._saveResults()
+
+    def getSummary(self) -> dict:
+        """ Metrics of the whole account. Orders, positions and fees are summed over the symbols. """
+        summary = self.summary.toDict()
+        symbolSummaries = [s.market.getSummary() for s in self.simulators]
+        for key in ('TakeProfits', 'StopLosses', 'ClosedPositions', 'NetProfit', 'Fees'):
+            summary[key] = sum(s[key] for s in symbolSummaries)
+        summary['MarginLimitedFills'] = sum(m.limitedFills for m in self.marginLimits)
+        summary['MaxGridReached'] = max((s['MaxGridReached'] for s in symbolSummaries if s['MaxGridReached'] is not None), default=None)
+        summary['Symbols'] = {str(s.bot): symbolSummary for s, symbolSummary in zip(self.simulators, symbolSummaries)}
+        return summary
+
+
+    ##### PRIVATE METHODS
+    @staticmethod
+    def _getPNLAndMargin(position, markPrice) -> tuple:
+        """ Unrealized PNL and margin used by a position. """
+        if position.entryPrice is None or position.size == 0:
+            return 0.0, 0.0
+        return position.getPNL(markPrice), abs(position.size) * position.entryPrice / config.LEVERAGE
+
+    def _getAvailableMargin(self) -> float:
+        """ Equity plus unrealized PNL minus the margin used by the positions of all the symbols, at their last price. """
+        availableMargin = self.account.equity
+        for simulator in self.simulators:
+            market = simulator.market
+            if market.position.entryPrice is not None:
+                pnl, margin = self._getPNLAndMargin(market.position, market.markPrice)
+                availableMargin += pnl - margin
+        return availableMargin
+
+    def _updateAccount(self, timestamp, totalPNL, totalMargin):
+        equity = self.account.equity
+        inMarket = totalMargin > 0
+        self.summary.updateTick(timestamp, equity, totalPNL if inMarket else None)
+        self.summary.updateDrawdown(totalPNL / equity * 100 if inMarket else None)
+        if self.recordResults:
+            self.dictList.append({
+                'Timestamp': timestamp,
+                'Equity': equity,
+                'PNL': totalPNL,
+                'Margin': totalMargin,
+                'AvailableMargin': equity + totalPNL - totalMargin,
+            })
+
+    def _saveResults(self):
+        Path(self.mainDataFolder).mkdir(parents=True, exist_ok=True)
+        for simulator in self.simulators:
+            simulator.results = simulator.market.getResults()
+            simulator.results.to_csv(self.mainDataFolder + f'{simulator.bot}.csv')
+
+        self.results = pd.DataFrame(self.dictList)
+        self.results['Date'] = [datetime.fromtimestamp(ts) for ts in self.results['Timestamp']]
+        self.results.set_index('Date', inplace=True)
+        self.results.to_csv(self.mainDataFolder + 'account.csv')
+        util.logger.info(f"Results saved in {self.mainDataFolder}")
+
+
+class MarginLimit:
+    """ Fill model of the market engines of a portfolio. The fills that increase a position are clipped to the margin
+        available in the shared account, an order that does not fit at all is not filled and stays open until enough
+        margin is released. Take profits and stop losses reduce the position and are never limited.
+        The fill model of the run, if any, decides the fill first.
+    """
+    def __init__(self, getAvailableMargin, fillModel=None):
+        self.getAvailableMargin = getAvailableMargin
+        self.fillModel = fillModel
+        self.limitedFills = 0 # fills reduced or skipped for lack of margin
+        self._timestamp = None
+        self._pendingMargin = 0.0 # margin of the fills of the current tick, not executed yet
+
+    def __str__(self):
+        return f"MarginLimit({self.fillModel})"
+
+    def getFill(self, order, timestamp, markPrice):
+        size, price = (order.size, order.price) if self.fillModel is None else self.fillModel.getFill(order, timestamp, markPrice)
+        if order.type in ('TP', 'SL') or size == 0:
+            return size, price
+
+        # the engine asks the fills of all the orders of a tick before executing them
+        if timestamp != self._timestamp:
+            self._timestamp = timestamp
+            self._pendingMargin = 0.0
+        availableMargin = self.getAvailableMargin() - self._pendingMargin
+        maxSize = math.floor(max(availableMargin, 0) * config.LEVERAGE / price * 1000) / 1000 # order sizes have 3 decimals
+        if abs(size) > maxSize:
+            self.limitedFills += 1
+            size = math.copysign(maxSize, size)
+        self._pendingMargin += abs(size) * price / config.LEVERAGE
+        return size, price
+
+
+##### CONFIGURATION
+def loadPortfolio(filePath) -> list:
+    """ Parses a portfolio configuration and returns one run per symbol. """
+    with open(filePath) as f:
+        settings = json.load(f)
+
+    runs = []
+    for symbolEntry in settings['symbols']:
+        if isinstance(symbolEntry, str):
+            symbolEntry = {'symbol': symbolEntry}
+        runEntry = {**settings.get('defaults', {}), **symbolEntry}
+        for key in ('initialEquity', 'leverage', 'startDate', 'endDate'):
+            runEntry[key] = settings[key] # shared by the whole account
+        runs += batch.expandRunEntry(runEntry)
+    return runs
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a portfolio of symbols on a shared account.")
+    parser.add_argument('settings', help="path of the portfolio JSON configuration")
+    parser.add_argument('-s', '--summary', default=None, help="path of the JSON summary (default: stdout)")
+    parser.add_argument('--summary-only', action='store_true', help="compute only the summary, without storing the per-minute results")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    portfolio = Portfolio(loadPortfolio(args.settings), not args.summary_only)
+    portfolio.startSimulation()
+
+    output = json.dumps(portfolio.getSummary(), indent=2, default=float)
+    if args.summary is None:
+        print(output)
+    else:
+        with open(args.summary, 'w') as f:
+            f.write(output)
+        util.logger.info(f"Summary saved in {args.summary}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
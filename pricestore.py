@@ -0,0 +1,54 @@
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+import util
+
+
+# Read-only price store shared by the simulations running on the same symbol and time window.
+# The csv dataset is parsed once and saved as a .npy structured array next to it; every process then memory-maps the
+# same file, so N workers share one copy of the data through the page cache and start without parsing anything.
+
+PRICES_DTYPE = np.dtype([('Timestamp', '<i8'), ('Price', '<f8')])
+
+
+def getStoreFilePath(datasetFilePath) -> str:
+    return str(Path(datasetFilePath).with_suffix('.npy'))
+
+
+def isStoreUpToDate(datasetFilePath) -> bool:
+    storeFilePath = getStoreFilePath(datasetFilePath)
+    return util.fileExists(storeFilePath) and Path(storeFilePath).stat().st_mtime >= Path(datasetFilePath).stat().st_mtime
+
+
+def createStore(datasetFilePath) -> str:
+    """ Parses the csv dataset and writes its timestamps and prices to the .npy store. Returns the store file path. """
+    df = util.loadDataset(datasetFilePath)
+    prices = np.empty(len(df), dtype=PRICES_DTYPE)
+    prices['Timestamp'] = df['Timestamp'].to_numpy()
+    prices['Price'] = df['Price'].to_numpy()
+
+    # write to a temporary file and rename, so that a process never attaches to a partially written store
+    storeFilePath = getStoreFilePath(datasetFilePath)
+    tmpFilePath = f'{storeFilePath}.{os.getpid()}.tmp'
+    with open(tmpFilePath, 'wb') as f:
+        np.save(f, prices)
+    os.replace(tmpFilePath, storeFilePath)
+    return storeFilePath
+
+
+def attachStore(datasetFilePath) -> np.ndarray:
+    """ Returns the prices of a dataset as a read-only memory-mapped structured array with the Timestamp and Price
+        fields, creating the store first if it is missing or older than the dataset.
+    """
+    if not isStoreUpToDate(datasetFilePath):
+        createStore(datasetFilePath)
+    return np.load(getStoreFilePath(datasetFilePath), mmap_mode='r')
+
+
+def fingerprintPrices(prices) -> str:
+    """ Returns the sha256 of timestamps and prices, the equivalent of util.fingerprintFile for prices in memory. """
+    sha = hashlib.sha256()
+    sha.update(np.ascontiguousarray(prices['Timestamp'], dtype='<i8').tobytes())
+    sha.update(np.ascontiguousarray(prices['Price'], dtype='<f8').tobytes())
+    return sha.hexdigest()
@@ -0,0 +1,103 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler:
+    """ Records wall time and memory allocations for each phase of a simulation.
+        When disabled every method is a no-op, so the callers do not need to check whether profiling is active.
+    """
+    def __init__(self, enabled=True, trackAllocations=False, profileEngine=False):
+        self.enabled = enabled
+        self.trackAllocations = enabled and trackAllocations
+        self.profileEngine = enabled and profileEngine
+        self.phases = []
+        self.engineStats = None
+
+    def setMode(self, mode):
+        """ Configures the profiler from the Profile value of the configuration file: OFF, TIME or FULL. """
+        self.enabled = mode != 'OFF'
+        self.trackAllocations = mode == 'FULL'
+        self.profileEngine = mode == 'FULL'
+
+    @contextmanager
+    def phase(self, name):
+        """ Measures the code executed inside the with block and stores it under the given phase name. """
+        if not self.enabled:
+            yield
+            return
+
+        startedTracing = False
+        if self.trackAllocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                startedTracing = True
+            tracemalloc.reset_peak()
+            memoryBefore = tracemalloc.get_traced_memory()[0]
+
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            phaseDict = {'Phase': name, 'WallTime': time.perf_counter() - startTime}
+            if self.trackAllocations:
+                memoryAfter, memoryPeak = tracemalloc.get_traced_memory()
+                phaseDict['Allocated'] = memoryAfter - memoryBefore
+                phaseDict['Peak'] = memoryPeak - memoryBefore
+                if startedTracing:
+                    tracemalloc.stop()
+            self.phases.append(phaseDict)
+
+    @contextmanager
+    def engine(self):
+        """ Optional cProfile capture, used around MarketEngine.startSimulation. """
+        if not self.profileEngine:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.engineStats = pstats.Stats(profile)
+
+    def getPhases(self):
+        return list(self.phases)
+
+    def report(self, nFunctions=20):
+        """ Returns a human readable report of the recorded phases and, if available, of the engine profile. """
+        lines = [f"{'Phase':<24}{'Wall time [s]':>16}"]
+        if self.trackAllocations:
+            lines[0] += f"{'Allocated [MB]':>18}{'Peak [MB]':>14}"
+
+        totalTime = 0
+        for phaseDict in self.phases:
+            totalTime += phaseDict['WallTime']
+            line = f"{phaseDict['Phase']:<24}{phaseDict['WallTime']:>16.3f}"
+            if 'Allocated' in phaseDict:
+                line += f"{phaseDict['Allocated'] / 2**20:>18.2f}{phaseDict['Peak'] / 2**20:>14.2f}"
+            lines.append(line)
+        lines.append(f"{'Total':<24}{totalTime:>16.3f}")
+
+        if self.engineStats is not None:
+            stream = io.StringIO()
+            self.engineStats.stream = stream
+            self.engineStats.sort_stats('cumulative').print_stats(nFunctions)
+            lines.append("\nMarketEngine.startSimulation profile:")
+            lines.append(stream.getvalue())
+
+        return '\n'.join(lines)
+
+    def saveReport(self, filePath):
+        with open(filePath, 'w') as f:
+            f.write(self.report())
+
+    def saveEngineStats(self, filePath):
+        """ Dumps the raw cProfile data, readable with pstats or snakeviz. """
+        if self.engineStats is not None:
+            self.engineStats.dump_stats(filePath)
@@ -0,0 +1,114 @@
+""" Headless rendering of the figures of simulation results.
+    Renders the .png (metrics) and _distr.png (distributions) figures next to each results .csv file, using the Agg
+    backend and a pool of worker processes. Figures that are newer than their results file are not rendered again.
+
+    Usage: python render.py results1.csv results2.csv ... [--workers N] [--force]
+           python render.py --queue render_queue.txt [--workers N] [--force]
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import util
+
+
+DEFAULT_QUEUE_FILE = 'render_queue.txt'
+
+
+##### RENDERING
+def getFigurePaths(resultsFilePath) -> tuple:
+    basePath = str(Path(resultsFilePath).with_suffix(''))
+    return basePath + '.png', basePath + '_distr.png'
+
+
+def isRendered(resultsFilePath) -> bool:
+    """ True if both figures exist and are newer than the results file. """
+    resultsTime = Path(resultsFilePath).stat().st_mtime
+    return all(Path(p).is_file() and Path(p).stat().st_mtime >= resultsTime for p in getFigurePaths(resultsFilePath))
+
+
+def renderResults(resultsFilePath, force=False):
+    """ Renders the figures of a results file. Returns None on success, the error message otherwise. """
+    try:
+        if not force and isRendered(resultsFilePath):
+            return None
+
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import analysis
+
+        df = util.loadDataset(resultsFilePath)
+        metricsFilePath, distributionsFilePath = getFigurePaths(resultsFilePath)
+        analysis.plotMetrics(df, Path(resultsFilePath).stem, metricsFilePath)
+        analysis.plotDistributions(df, distributionsFilePath)
+        plt.close('all')
+        return None
+    except Exception as e:
+        util.logger.error(f"Error rendering {resultsFilePath}: {e}")
+        return str(e)
+
+
+def renderAll(resultsFilePaths, workers=1, force=False) -> dict:
+    """ Renders the figures of many results files in a process pool. Returns a dictionary results file -> error (None on success). """
+    resultsFilePaths = list(dict.fromkeys(resultsFilePaths)) # remove duplicates, keep the order
+    util.logger.info(f"Rendering figures of {len(resultsFilePaths)} results files ...")
+    if workers <= 1:
+        errors = [renderResults(p, force) for p in resultsFilePaths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(util.ch.level,)) as executor:
+            errors = list(executor.map(renderResults, resultsFilePaths, [force] * len(resultsFilePaths)))
+    return dict(zip(resultsFilePaths, errors))
+
+
+def _initWorker(consoleLevel):
+    import matplotlib
+    matplotlib.use('Agg')
+    util.ch.setLevel(consoleLevel)
+
+
+##### DEFERRED RENDERING
+def appendToQueue(resultsFilePaths, queueFilePath=DEFAULT_QUEUE_FILE) -> None:
+    """ Defers the rendering: the results files are appended to a queue file, rendered later with --queue. """
+    with open(queueFilePath, 'a') as f:
+        for resultsFilePath in resultsFilePaths:
+            f.write(f'{resultsFilePath}\n')
+
+
+def readQueue(queueFilePath=DEFAULT_QUEUE_FILE) -> list:
+    with open(queueFilePath) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Render the figures of simulation results without a display.")
+    parser.add_argument('results', nargs='*', help="results .csv files")
+    parser.add_argument('--queue', default=None, help="render the results files listed in a queue file, then empty it")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument('-f', '--force', action='store_true', help="render again figures that are up to date")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    resultsFilePaths = list(args.results)
+    if args.queue is not None:
+        resultsFilePaths += readQueue(args.queue)
+
+    errors = renderAll(resultsFilePaths, args.workers, args.force)
+    failedFilePaths = [p for p, error in errors.items() if error is not None]
+
+    if args.queue is not None:
+        # keep only the failed entries in the queue
+        with open(args.queue, 'w') as f:
+            for resultsFilePath in failedFilePaths:
+                f.write(f'{resultsFilePath}\n')
+
+    util.logger.info(f"Rendered {len(errors) - len(failedFilePaths)}/{len(errors)} results files")
+    return 1 if failedFilePaths else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+""" Local websocket server replaying recorded stream messages.
+    Stands in for the Binance stream endpoints to test the paper trading offline: point STREAM_URL and FSTREAM_URL of a
+    BinanceSocketManager to the server and every message of the recording is sent to the first client that connects.
+    Recordings are JSON lines files, one raw stream message per line, as written by papertrading.py --record.
+"""
+from autobahn.twisted.websocket import WebSocketServerFactory, WebSocketServerProtocol
+from twisted.internet import reactor
+
+import util
+
+
+class ReplayServerProtocol(WebSocketServerProtocol):
+
+    def onOpen(self):
+        self.factory.replay(self)
+
+    def onClose(self, wasClean, code, reason):
+        if self.factory.replayed and self.factory.finishedCallback is not None:
+            self.factory.finishedCallback()
+
+
+class ReplayServerFactory(WebSocketServerFactory):
+    """ Sends the recorded messages once, then closes the connection. Later connections (e.g. the reconnection of the
+        client) receive nothing, so the recording is never delivered twice.
+    """
+    protocol = ReplayServerProtocol
+
+    def __init__(self, messages, finishedCallback=None):
+        super().__init__()
+        # the client may take a while to process a long recording before it answers the close handshake
+        self.setProtocolOptions(closeHandshakeTimeout=0)
+        self.messages = messages
+        self.finishedCallback = finishedCallback # called once the client received all the messages
+        self.replayed = False
+
+    def replay(self, protocol):
+        if self.replayed:
+            return
+        self.replayed = True
+        util.logger.info(f"Replaying {len(self.messages)} messages")
+        for message in self.messages:
+            protocol.sendMessage(message)
+        # the close handshake comes after the messages, the client has received all of them when it completes
+        protocol.sendClose()
+
+
+def loadRecording(filePath) -> list:
+    with open(filePath, 'rb') as f:
+        return [line.rstrip(b'\n') for line in f if line.strip()]
+
+
+def startReplayServer(messages, finishedCallback=None, port=0) -> str:
+    """ Listens on localhost, port 0 picks a free port. Returns the base url to use as STREAM_URL/FSTREAM_URL.
+        Must be called before the reactor runs or from the reactor thread.
+    """
+    factory = ReplayServerFactory(messages, finishedCallback)
+    listeningPort = reactor.listenTCP(port, factory, interface='127.0.0.1')
+    return f'ws://127.0.0.1:{listeningPort.getHost().port}/'
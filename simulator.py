@@ -1,50 +1,210 @@
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import analysis
+import config
+import pricestore
 import util
+from cache import ResultsCache
 from market_engine import MarketEngine
+from profiling import Profiler
 
 
 class Simulator:
     """ Handles general information and configuration of the simulation.
-        Links the bot with the market engine through callbacks.
+        Links the bot with the market engine through callbacks. bot can also be a list of bots trading the same symbol
+        on the same account, each one with its own position.
     """
-    def __init__(self, initialEquity, startDate, endDate, bot):
+    def __init__(self, initialEquity, startDate, endDate, bot, profiler=None, cache=None, recordResults=True, symbolData=None, abortConditions=None, account=None, fillModel=None):
         self.initialEquity = initialEquity
         self.startDate = startDate
         self.endDate = endDate
-        self.bot = bot
-        self.mainDataFolder = self._getMainDataFolder()
-        self.resultsFilePath = self.mainDataFolder + f'{self.bot}.csv'
+        self.bots = bot if isinstance(bot, list) else [bot]
+        self.bot = self.bots[0]
+        if any(b.symbol != self.bot.symbol for b in self.bots):
+            raise ValueError("All the bots of a simulation must trade the same symbol")
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self.cache = cache if cache is not None else ResultsCache()
+        self.recordResults = recordResults # if False only the summary is computed, results stays None
+        self.mainDataFolder = util.getMainDataFolder(self.startDate, self.endDate)
+        self.symbolDataFilePath = util.getSymbolDataFilePath(self.bot.symbol, self.startDate, self.endDate)
+        self.symbolData = symbolData # prices already in memory (e.g. a slice of a price store), the dataset file is not used
+        self.results = None
+        self.summary = None
+        self._cacheInputs = None # computed once, the dataset fingerprint hashes the whole price series
+        self._cacheKey = None
 
-        self.market = MarketEngine()
+        self.market = MarketEngine(recordResults, account)
+        if abortConditions is not None and abortConditions.isEnabled():
+            self.market.abortConditions = abortConditions
+        self.market.fillModel = fillModel
 
-        # link bot and market through callbacks
-        self.bot.addOrderCallback = self.market.addOrder
-        self.bot.cancelOrderCallback = self.market.cancelOrder
-        self.bot.getOpenOrdersCallback = self.market.getOpenOrders
-        self.bot.getEquityCallback = self.market.getEquity
-        self.market.orderExecutedCallback = self.bot.orderExecutedCallback
+        # link bots and market through callbacks
+        for b in self.bots:
+            self.market.addBot(b)
 
     def startSimulation(self):
         # load results if already available, perform the simulation otherwise
 
-        if util.fileExists(self.resultsFilePath):
-            util.logger.info(f"Results for this simulation are already available: {self.resultsFilePath}")
-            self.results = util.loadDataset(self.resultsFilePath)
+        if self.symbolData is None and not util.fileExists(self.symbolDataFilePath):
+            util.logger.info(f"Downloading dataset to: {self.symbolDataFilePath} ...")
+            with self.profiler.phase('dataset download'):
+                util.downloadSymbolData(self.symbolDataFilePath)
+            self._invalidateCacheKey()
+
+        cacheKey = self.getCacheKey()
+        cacheInputs = self.getCacheInputs()
+        cachedFilePath = self.cache.get(cacheKey) if self.recordResults else None
+        self.summary = self.cache.getSummary(cacheKey)
+
+        if cachedFilePath is not None:
+            util.logger.info(f"Results for this simulation are already available: {cachedFilePath}")
+            with self.profiler.phase('results load'):
+                self.results = util.loadDataset(cachedFilePath)
+            if self.summary is None:
+                self.summary = analysis.computeSummary(self.results)
+            # export the results in the simulation folder, figures are rendered from it
+            if not util.fileExists(self.resultsFilePath):
+                Path(self.mainDataFolder).mkdir(parents=True, exist_ok=True)
+                tmpFilePath = f'{self.resultsFilePath}.{os.getpid()}.tmp'
+                shutil.copyfile(cachedFilePath, tmpFilePath)
+                os.replace(tmpFilePath, self.resultsFilePath)
+        elif not self.recordResults and self.summary is not None:
+            util.logger.info("Summary for this simulation is already available")
         else:
-            symbolDataFilePath = self.mainDataFolder + self.bot.symbol + '_prices.csv'
-            symbolData = util.getSymbolData(symbolDataFilePath)
+            symbolData = self.symbolData
+            if symbolData is None:
+                with self.profiler.phase('dataset parse'):
+                    symbolData = pricestore.attachStore(self.symbolDataFilePath)
+            resumed, previousResults = self._resumeFromCheckpoint(symbolData)
 
             util.logger.info("Simulation started")
-            self.bot.createInitialGrid(startPrice=symbolData['Price'][0])
-            self.market.startSimulation(symbolData)
+            with self.profiler.phase('simulation loop'), self.profiler.engine():
+                if not resumed:
+                    for b in self.bots:
+                        b.createInitialGrid(startPrice=symbolData['Price'][0])
+                    self.market.startSimulation(symbolData)
+                else:
+                    startIndex = symbolData['Timestamp'].searchsorted(self.market.timestamp, side='right')
+                    self.market.startSimulation(symbolData, startIndex)
+            self.summary = self.market.getSummary()
+
+            if self.recordResults:
+                with self.profiler.phase('results conversion'):
+                    if previousResults is None:
+                        self.results = self.market.getResults()
+                    elif len(self.market.dictList) == 0:
+                        self.results = previousResults
+                    else:
+                        self.results = pd.concat([previousResults, self.market.getResults()])
+                with self.profiler.phase('csv write'):
+                    Path(self.mainDataFolder).mkdir(parents=True, exist_ok=True)
+                    # written to a file of this process only, then moved in place: parallel runs never share a file
+                    tmpFilePath = f'{self.resultsFilePath}.{os.getpid()}.tmp'
+                    self.results.to_csv(tmpFilePath)
+                    self.cache.put(cacheKey, tmpFilePath, cacheInputs)
+                    os.replace(tmpFilePath, self.resultsFilePath)
+                util.logger.info(f"Results saved in {self.mainDataFolder}")
 
-            self.results = self.market.getResults()
-            self.results.to_csv(self.resultsFilePath)
-            util.logger.info(f"Results saved in {self.mainDataFolder}")
+            self.cache.putSummary(cacheKey, self.summary, cacheInputs)
+            if not self.market.aborted:
+                self._saveCheckpoint()
 
-    def _getMainDataFolder(self):
-        """ The data folder of a simulation is defined by the start and end dates.
-            It has the format: datasets/yyyy-MM-dd-hhh-mmm_yyyy-MM-dd-hhh-mmm/
+    def getName(self) -> str:
+        """ Name of the bots, used for the results file and the cache key. """
+        return '+'.join(str(b) for b in self.bots)
+
+    @property
+    def resultsFilePath(self) -> str:
+        """ Exported results file. The bots name is followed by the beginning of the cache key, so simulations of the
+            same bots with different inputs (equity, leverage, abort conditions, fill model...) never share a file.
+            Available once the dataset exists, since the key includes its fingerprint.
         """
-        startDateString = f"{self.startDate.year}-{self.startDate.month:02d}-{self.startDate.day:02d}-{self.startDate.hour:02d}h-{self.startDate.minute:02d}m"
-        endDateString = f"{self.endDate.year}-{self.endDate.month:02d}-{self.endDate.day:02d}-{self.endDate.hour:02d}h-{self.endDate.minute:02d}m"
-        return f'datasets/{startDateString}_{endDateString}/'
\ No newline at end of file
+        return self.mainDataFolder + f'{self.getName()}_{self.getCacheKey()[:10]}.csv'
+
+    def isCached(self) -> bool:
+        """ True if the results (the summary, if results are not recorded) of this simulation are in the results cache. """
+        if self.symbolData is None and not util.fileExists(self.symbolDataFilePath):
+            return False
+        if self.recordResults:
+            return self.cache.get(self.getCacheKey()) is not None
+        return self.cache.getSummary(self.getCacheKey()) is not None
+
+    def getCacheInputs(self) -> dict:
+        """ All the inputs that determine the results of the simulation, including the dataset fingerprint.
+            Computed on the first call, until the inputs change (see _invalidateCacheKey).
+        """
+        if self._cacheInputs is None:
+            self._cacheInputs = self._computeCacheInputs()
+        return dict(self._cacheInputs)
+
+    def _computeCacheInputs(self) -> dict:
+        return {
+            'Bot': self.getName(),
+            'BotType': '+'.join(type(b).__name__ for b in self.bots),
+            'StartDate': self.startDate,
+            'EndDate': self.endDate,
+            'InitialEquity': config.INITIAL_EQUITY,
+            'Leverage': config.LEVERAGE,
+            'OrderFeePercentage': MarketEngine.ORDER_FEE_PERCENTAGE,
+            'EngineVersion': MarketEngine.VERSION,
+            'AbortConditions': str(self.market.abortConditions) if self.market.abortConditions is not None else None,
+            'FillModel': str(self.market.fillModel) if self.market.fillModel is not None else None,
+            'Dataset': util.fingerprintFile(self.symbolDataFilePath) if self.symbolData is None else pricestore.fingerprintPrices(self.symbolData),
+        }
+
+    def getCacheKey(self) -> str:
+        if self._cacheKey is None:
+            self._cacheKey = ResultsCache.computeKey(self.getCacheInputs())
+        return self._cacheKey
+
+    def _invalidateCacheKey(self):
+        # called when an input changes, e.g. the dataset file is downloaded
+        self._cacheInputs = None
+        self._cacheKey = None
+
+    def getCheckpointKey(self) -> str:
+        """ Identifies the simulations that differ only in their end date, and can therefore be resumed from each other. """
+        inputs = self.getCacheInputs()
+        del inputs['EndDate']
+        del inputs['Dataset']
+        return ResultsCache.computeKey(inputs)
+
+    def _saveCheckpoint(self):
+        # the results stay in the cache, the checkpoint refers to them by key
+        checkpoint = {'Market': self.market.getState(), 'ResultsKey': self.getCacheKey() if self.recordResults else None}
+        self.cache.putCheckpoint(self.getCheckpointKey(), self.market.timestamp, checkpoint, self.getCacheInputs())
+
+    def _resumeFromCheckpoint(self, symbolData):
+        """ Restores the market from the most recent checkpoint of the same simulation with an earlier end date.
+            Returns (resumed, results of the checkpointed simulation), (False, None) if there is no usable checkpoint.
+        """
+        timestamps = symbolData['Timestamp']
+        endTimestamp = int(timestamps[-1])
+        checkpoint = self.cache.getCheckpoint(self.getCheckpointKey(), endTimestamp)
+        if checkpoint is None:
+            return False, None
+
+        # the checkpointed simulation used a different dataset, make sure the prices match at the checkpoint
+        marketState = checkpoint['Market']
+        i = timestamps.searchsorted(marketState['timestamp'])
+        if i >= len(timestamps) or timestamps[i] != marketState['timestamp'] or symbolData['Price'][i] != marketState['markPrice']:
+            util.logger.info("Checkpoint does not match the dataset, simulating the whole window")
+            return False, None
+
+        previousResults = None
+        if self.recordResults:
+            resultsKey = checkpoint.get('ResultsKey')
+            cachedFilePath = self.cache.get(resultsKey) if resultsKey is not None else None
+            if cachedFilePath is None:
+                util.logger.info("Checkpoint found but its results are not cached, simulating the whole window")
+                return False, None
+            with self.profiler.phase('results load'):
+                # parsed back to the same floats, a resumed simulation gives exactly the numbers of a full one
+                previousResults = util.loadDataset(cachedFilePath, exact=True)
+
+        self.market.setState(marketState)
+        util.logger.info(f"Resuming simulation from checkpoint at {datetime.fromtimestamp(marketState['timestamp'])}")
+        return True, previousResults
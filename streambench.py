@@ -0,0 +1,101 @@
+""" Benchmark of the decoding of the websocket messages.
+    Feeds synthetic Binance messages to BinanceClientProtocol.onMessage, as the reactor does, with every JSON decoder
+    installed and with a SymbolFilter, and prints the messages decoded per second. The baseline is the decoding used
+    before the decoders became pluggable (ujson on the message decoded to str).
+
+    Usage: python streambench.py [--seconds 1] [--symbols 200]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from binance.streams import SymbolFilter, get_decoder
+from binance.websockets import BinanceClientProtocol
+
+
+class _Factory:
+    """ Stands in for BinanceClientFactory: counts the callbacks. """
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.nCallbacks = 0
+
+    def callback(self, message):
+        self.nCallbacks += 1
+
+
+def _baselineDecoder(payload):
+    import ujson
+    return ujson.loads(payload.decode('utf8'))
+
+
+def createMessages(nSymbols, seed=0) -> dict:
+    """ Returns name -> payload of a few message types, the all-market ones with nSymbols symbols. """
+    rng = random.Random(seed)
+    symbols = [f'S{i}USDT' for i in range(nSymbols - 1)] + ['LTCUSDT']
+
+    def markPrice(symbol):
+        return {'e': 'markPriceUpdate', 'E': 1562305380000, 's': symbol, 'p': f'{rng.uniform(1, 100):.8f}',
+                'i': f'{rng.uniform(1, 100):.8f}', 'P': f'{rng.uniform(1, 100):.8f}', 'r': '0.00038167', 'T': 1562306400000}
+
+    messages = {
+        'aggTrade': {'e': 'aggTrade', 'E': 123456789, 's': 'LTCUSDT', 'a': 5933014, 'p': '178.32', 'q': '100', 'f': 100,
+                     'l': 105, 'T': 123456785, 'm': True},
+        'bookTicker of another symbol': {'u': 400900217, 's': 'BNBUSDT', 'b': '25.35190000', 'B': '31.21000000',
+                                         'a': '25.36520000', 'A': '40.66000000'},
+        'markPrice (combined)': {'stream': 'ltcusdt@markPrice@1s', 'data': markPrice('LTCUSDT')},
+        f'!markPrice@arr x{nSymbols} (combined)': {'stream': '!markPrice@arr@1s', 'data': [markPrice(s) for s in symbols]},
+    }
+    return {name: json.dumps(message, separators=(',', ':')).encode('utf8') for name, message in messages.items()}
+
+
+def measure(decoder, payload, seconds) -> float:
+    """ Returns the messages per second handled by onMessage with the given decoder. """
+    protocol = BinanceClientProtocol()
+    protocol.factory = _Factory(decoder)
+    nMessages = 0
+    startTime = time.perf_counter()
+    while time.perf_counter() - startTime < seconds:
+        for _ in range(100):
+            protocol.onMessage(payload, False)
+        nMessages += 100
+    return nMessages / (time.perf_counter() - startTime)
+
+
+def getDecoders() -> dict:
+    decoders = {}
+    try:
+        import ujson
+        decoders['baseline (ujson, str)'] = _baselineDecoder
+    except ImportError:
+        pass
+    for name in ('json', 'ujson', 'orjson'):
+        try:
+            decoders[name] = get_decoder(name)
+        except ValueError:
+            pass
+    decoders['SymbolFilter LTCUSDT'] = SymbolFilter(['LTCUSDT'])
+    return decoders
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the messages per second decoded by the socket manager.")
+    parser.add_argument('--seconds', type=float, default=1, help="duration of each measure (default: 1)")
+    parser.add_argument('--symbols', type=int, default=200, help="symbols of the all-market messages (default: 200)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    decoders = getDecoders()
+    for messageName, payload in createMessages(args.symbols).items():
+        print(f"{messageName} ({len(payload)} bytes)")
+        for decoderName, decoder in decoders.items():
+            print(f"  {decoderName:24s} {measure(decoder, payload, args.seconds):12,.0f} msg/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,11 @@
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
 from pathlib import Path
 import config
 import xml.etree.ElementTree as ET
 import pandas as pd
-from binance.client import Client
 
 
 ##### LOGGER
@@ -75,6 +76,20 @@ def parseConfigFile(filePath) -> bool:
         if config.SL is not None:
             config.SL = float(config.SL.strip())
 
+        # optional node, profiling is disabled if missing
+        profileNode = root.find('Profile')
+        config.PROFILE = 'OFF'
+        if profileNode is not None and profileNode.text is not None:
+            config.PROFILE = profileNode.text.strip().upper()
+        if config.PROFILE not in ('OFF', 'TIME', 'FULL'):
+            raise ValueError(f"{config.PROFILE} is not a valid profile mode")
+
+        # optional node, plots are created if missing
+        plotNode = root.find('Plot')
+        config.PLOT = True
+        if plotNode is not None and plotNode.text is not None:
+            config.PLOT = plotNode.text.strip().upper() in ('YES', 'TRUE', '1')
+
         return True
 
     except Exception as e:
@@ -82,41 +97,114 @@ def parseConfigFile(filePath) -> bool:
         return False
 
 
+def getMainDataFolder(startDate, endDate) -> str:
+    """ The data folder of a simulation is defined by the start and end dates.
+        It has the format: datasets/yyyy-MM-dd-hhh-mmm_yyyy-MM-dd-hhh-mmm/
+    """
+    startDateString = f"{startDate.year}-{startDate.month:02d}-{startDate.day:02d}-{startDate.hour:02d}h-{startDate.minute:02d}m"
+    endDateString = f"{endDate.year}-{endDate.month:02d}-{endDate.day:02d}-{endDate.hour:02d}h-{endDate.minute:02d}m"
+    return f'datasets/{startDateString}_{endDateString}/'
+
+
+def getSymbolDataFilePath(symbol, startDate, endDate) -> str:
+    """ Path of the 1 minute prices of symbol between the two dates, in the data folder of the simulation. """
+    return getMainDataFolder(startDate, endDate) + symbol + '_prices.csv'
+
+
 def fileExists(filePath) -> bool:
     return Path(filePath).is_file()
 
 
-def loadDataset(filePath) -> pd.DataFrame:
-    return pd.read_csv(filePath, parse_dates=['Date'], index_col='Date')
+_fingerprints = {}
+
 
+def toTimestamp(date) -> int:
+    """ Unix timestamp in seconds of a datetime, the unit of the price store timestamps. """
+    return int(datetime.timestamp(date))
 
-def getSymbolData(filePath) -> pd.DataFrame:
-    if not fileExists(filePath):
-        logger.info(f"Downloading dataset to: {filePath} ...")
-        downloadSymbolData(filePath)
 
-    logger.info(f"Loading dataset ...")
-    return loadDataset(filePath)
+def fingerprintFile(filePath) -> str:
+    """ Returns the sha256 of the file content. Cached in memory as long as size and modification time do not change. """
+    stat = Path(filePath).stat()
+    cacheKey = (str(filePath), stat.st_size, stat.st_mtime_ns)
+    if cacheKey not in _fingerprints:
+        sha = hashlib.sha256()
+        with open(filePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha.update(chunk)
+        _fingerprints[cacheKey] = sha.hexdigest()
+    return _fingerprints[cacheKey]
+
+
+def loadDataset(filePath, exact=False) -> pd.DataFrame:
+    """ If exact, the floats are parsed back to the values that were written (slower). """
+    return pd.read_csv(filePath, parse_dates=['Date'], index_col='Date', float_precision='round_trip' if exact else None)
+
+
+def downloadSymbolData(filePath, symbol=None, startDate=None, endDate=None) -> None:
+    """ Downloads the 1 minute prices of symbol between the two dates, those of the configuration by default. """
+    errors = downloadSymbolsData([(filePath, symbol, startDate, endDate)])
+    if errors:
+        raise errors[filePath]
+
+
+def downloadSymbolsData(datasets, maxConcurrent=10) -> dict:
+    """ Downloads several datasets, datasets is a list of (filePath, symbol, startDate, endDate).
+        With aiohttp installed all the requests of all the datasets run concurrently within the rate limits of Binance,
+        otherwise the datasets are downloaded one after the other. Returns filePath -> exception of the failed downloads.
+    """
+    # imported here so that runs with a cached dataset never load the binance client and its dependencies
+    from binance import asyncclient
 
+    if asyncclient.aiohttp is None:
+        from binance.client import Client
 
-def downloadSymbolData(filePath) -> None:
         client = Client('', '')
-        startTsMs = int(datetime.timestamp(config.START_DATE) * 1000)
-        endTsMs = int(datetime.timestamp(config.END_DATE) * 1000)
-        klines = client.get_historical_klines(config.SYMBOL, Client.KLINE_INTERVAL_1MINUTE, startTsMs, endTsMs)
-
-        dataDictList = []
-        for i in range(len(klines)):
-            dataDict = {}
-            timestamp = int(klines[i][0] / 1000)
-            dataDict['Date'] = datetime.fromtimestamp(timestamp)
-            dataDict['Timestamp'] = timestamp
-            dataDict['Price'] = float(klines[i][1])
-            dataDictList.append(dataDict)
-
-        df = pd.DataFrame(dataDictList)
-        df.set_index('Date', inplace=True)
-
-        # create main data folder
-        Path(str(Path(filePath).parent)).mkdir(parents=True, exist_ok=True)
-        df.to_csv(filePath)
\ No newline at end of file
+        errors = {}
+        for filePath, symbol, startDate, endDate in datasets:
+            try:
+                symbol, startTsMs, endTsMs = _getDatasetRange(symbol, startDate, endDate)
+                klines = client.get_historical_klines(symbol, Client.KLINE_INTERVAL_1MINUTE, startTsMs, endTsMs)
+                saveSymbolData(klines, filePath)
+            except Exception as e:
+                errors[filePath] = e
+        return errors
+
+    async def download(client, filePath, symbol, startDate, endDate):
+        symbol, startTsMs, endTsMs = _getDatasetRange(symbol, startDate, endDate)
+        klines = await client.get_historical_klines(symbol, '1m', startTsMs, endTsMs)
+        saveSymbolData(klines, filePath)
+        logger.info(f"Dataset downloaded: {filePath}")
+
+    async def downloadAll():
+        rateLimiter = asyncclient.RateLimiter(max_concurrent=maxConcurrent)
+        async with asyncclient.AsyncClient(rate_limiter=rateLimiter) as client:
+            return await asyncio.gather(*[download(client, *dataset) for dataset in datasets], return_exceptions=True)
+
+    results = asyncio.run(downloadAll())
+    return {dataset[0]: result for dataset, result in zip(datasets, results) if isinstance(result, Exception)}
+
+
+def _getDatasetRange(symbol, startDate, endDate):
+    symbol = config.SYMBOL if symbol is None else symbol
+    startDate = config.START_DATE if startDate is None else startDate
+    endDate = config.END_DATE if endDate is None else endDate
+    return symbol, int(datetime.timestamp(startDate) * 1000), int(datetime.timestamp(endDate) * 1000)
+
+
+def saveSymbolData(klines, filePath) -> None:
+    dataDictList = []
+    for i in range(len(klines)):
+        dataDict = {}
+        timestamp = int(klines[i][0] / 1000)
+        dataDict['Date'] = datetime.fromtimestamp(timestamp)
+        dataDict['Timestamp'] = timestamp
+        dataDict['Price'] = float(klines[i][1])
+        dataDictList.append(dataDict)
+
+    df = pd.DataFrame(dataDictList)
+    df.set_index('Date', inplace=True)
+
+    # create main data folder
+    Path(str(Path(filePath).parent)).mkdir(parents=True, exist_ok=True)
+    df.to_csv(filePath)
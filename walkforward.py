@@ -0,0 +1,187 @@
+""" Walk-forward optimization.
+    Splits a long price range in rolling train/test windows. On each train window all the parameter combinations of the
+    grid are simulated in parallel, the best one according to the objective is then simulated on the following test
+    window. The test windows are stitched together into an out-of-sample equity curve.
+    The prices are loaded once in a memory-mapped price store, every simulation runs on a slice of it.
+
+    Usage: python walkforward.py walkforward.json [--workers N]
+
+    Configuration format:
+    {
+        "symbol": "LTCUSDT", "buySell": "LONG", "initialEquity": 1000, "leverage": 20,
+        "startDate": "2021-01-01", "endDate": "2021-07-01",
+        "trainDays": 28, "testDays": 7, "stepDays": 7, "objective": "calmar",
+        "grid": {"GO": 7, "GS": [0.2, 0.3, 0.4], "SF": 2, "OS": [0.5, 0.8], "OF": 2.2, "TS": [0.3, 0.5], "SL": null}
+    }
+"""
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import batch
+import pricestore
+import util
+
+
+OBJECTIVES = {
+    'profit': lambda summary: summary['Profit %'],
+    'sharpe': lambda summary: summary['SharpeRatio'],
+    'calmar': lambda summary: summary['Profit %'] / max(abs(summary['MaxEquityDrawdown %']), 0.01),
+}
+
+
+##### WINDOWS
+def getWindows(timestamps, startDate, endDate, trainDays, testDays, stepDays=None) -> list:
+    """ Returns the rolling windows as (trainStart, trainEnd, testEnd) index tuples into timestamps. """
+    if stepDays is None:
+        stepDays = testDays
+
+    windows = []
+    trainStartDate = startDate
+    while True:
+        trainEndDate = trainStartDate + timedelta(days=trainDays)
+        testEndDate = trainEndDate + timedelta(days=testDays)
+        if testEndDate > endDate:
+            break
+        indices = np.searchsorted(timestamps, [util.toTimestamp(d) for d in (trainStartDate, trainEndDate, testEndDate)])
+        windows.append(tuple(int(i) for i in indices))
+        trainStartDate += timedelta(days=stepDays)
+    return windows
+
+
+##### SIMULATIONS
+def simulateWindow(datasetFilePath, run, startIndex, endIndex, recordResults=False):
+    """ Simulates a run on a slice of the price store. Executed in the worker processes. """
+    prices = pricestore.attachStore(datasetFilePath)[startIndex:endIndex]
+    run = dict(run)
+    run['startDate'] = datetime.fromtimestamp(int(prices['Timestamp'][0]))
+    run['endDate'] = datetime.fromtimestamp(int(prices['Timestamp'][-1]) + 60)
+
+    simulator = batch.createSimulator(run, recordResults, symbolData=prices)
+    simulator.startSimulation()
+    return simulator.summary, simulator.results
+
+
+def _trainTask(args):
+    datasetFilePath, run, startIndex, endIndex = args
+    try:
+        return simulateWindow(datasetFilePath, run, startIndex, endIndex)[0]
+    except Exception as e:
+        util.logger.error(f"Train simulation failed: {e}")
+        return None
+
+
+def _testTask(args):
+    datasetFilePath, run, startIndex, endIndex = args
+    return simulateWindow(datasetFilePath, run, startIndex, endIndex, recordResults=True)
+
+
+def runWalkForward(settings, workers=1) -> dict:
+    """ Runs the walk-forward optimization. Returns the report of each window and the stitched out-of-sample equity. """
+    startDate = batch.parseDate(settings['startDate'])
+    endDate = batch.parseDate(settings['endDate'])
+    objective = OBJECTIVES[settings.get('objective', 'profit')]
+
+    fixedParameters = {k: settings[k] for k in ('symbol', 'buySell', 'initialEquity', 'leverage')}
+    fixedParameters.update({k: settings[k] for k in batch.FILL_KEYS if k in settings})
+    runs = batch.expandRunEntry({**fixedParameters, **settings['grid'], 'startDate': startDate, 'endDate': endDate})
+
+    # download the whole range once, every simulation uses a slice of its price store
+    batch.prepareDatasets(runs[:1])
+    datasetFilePath = batch.getDatasetFilePath(runs[0])
+    timestamps = np.asarray(pricestore.attachStore(datasetFilePath)['Timestamp'])
+    windows = getWindows(timestamps, startDate, endDate, settings['trainDays'], settings['testDays'], settings.get('stepDays'))
+    util.logger.info(f"Walk-forward: {len(windows)} windows, {len(runs)} parameter combinations")
+
+    with ProcessPoolExecutor(max_workers=max(workers, 1), initializer=batch.initWorker, initargs=(util.ch.level,)) as executor:
+        # all the train simulations of all the windows are independent, submit them at once
+        trainTasks = [(datasetFilePath, run, trainStart, trainEnd) for trainStart, trainEnd, _ in windows for run in runs]
+        trainSummaries = list(executor.map(_trainTask, trainTasks))
+
+        bestRuns = []
+        for w in range(len(windows)):
+            scores = []
+            for summary in trainSummaries[w * len(runs):(w + 1) * len(runs)]:
+                score = objective(summary) if summary is not None else None
+                scores.append(-np.inf if score is None or np.isnan(score) else score)
+            if all(score == -np.inf for score in scores):
+                # no train simulation succeeded, there is no best run to test
+                util.logger.error(f"Walk-forward window {w + 1}/{len(windows)}: all the train simulations failed, window skipped")
+                bestRuns.append(None)
+                continue
+            bestIndex = int(np.argmax(scores))
+            bestRuns.append((runs[bestIndex], scores[bestIndex], trainSummaries[w * len(runs) + bestIndex]))
+
+        testTasks = [(datasetFilePath, best[0], trainEnd, testEnd) for (_, trainEnd, testEnd), best in zip(windows, bestRuns) if best is not None]
+        testOutputs = list(executor.map(_testTask, testTasks))
+
+    testOutputs = iter(testOutputs) # one per window with a best run
+    reports = []
+    equityCurves = []
+    carry = 1.0
+    for (trainStart, trainEnd, testEnd), best in zip(windows, bestRuns):
+        report = {
+            'TrainStart': datetime.fromtimestamp(int(timestamps[trainStart])).isoformat(),
+            'TestStart': datetime.fromtimestamp(int(timestamps[trainEnd])).isoformat(),
+            'TestEnd': datetime.fromtimestamp(int(timestamps[testEnd - 1])).isoformat(),
+        }
+        if best is None:
+            # the stitched equity has a gap over this test window
+            reports.append({**report, 'Status': 'failed'})
+            continue
+        bestRun, trainScore, trainSummary = best
+        testSummary, testResults = next(testOutputs)
+        reports.append({
+            **report,
+            'Status': 'tested',
+            'Parameters': {k: bestRun[k] for k in ('GO', 'GS', 'SF', 'OS', 'OF', 'TS', 'SL')},
+            'TrainObjective': trainScore,
+            'TrainSummary': trainSummary,
+            'TestSummary': testSummary,
+        })
+
+        # out-of-sample equity including the unrealized PNL, compounded from one test window to the next
+        value = (testResults['Equity'] + testResults['PNL'].fillna(0)) / bestRun['initialEquity']
+        equityCurves.append(value * carry * settings['initialEquity'])
+        carry *= value.iloc[-1]
+
+    stitchedEquity = pd.concat(equityCurves).rename('Equity') if equityCurves else pd.Series(dtype=float, name='Equity')
+    return {'Windows': reports, 'Equity': stitchedEquity}
+
+
+##### CLI
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of the strategy parameters.")
+    parser.add_argument('settings', help="path of the walk-forward JSON configuration")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument('-o', '--output', default='datasets/walkforward/', help="output folder (default: datasets/walkforward/)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parseArguments(argv)
+    with open(args.settings) as f:
+        settings = json.load(f)
+
+    output = runWalkForward(settings, args.workers)
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    baseFilePath = args.output + Path(args.settings).stem
+    output['Equity'].to_csv(baseFilePath + '_equity.csv')
+    with open(baseFilePath + '_report.json', 'w') as f:
+        json.dump(output['Windows'], f, indent=2, default=float)
+
+    if len(output['Equity']) > 0:
+        profit = (output['Equity'].iloc[-1] / settings['initialEquity'] - 1) * 100
+        util.logger.info(f"Out-of-sample profit: {profit:.2f} % over {len(output['Windows'])} test windows")
+    util.logger.info(f"Walk-forward results saved in {baseFilePath}_equity.csv and {baseFilePath}_report.json")
+    return 1 if any(w['Status'] == 'failed' for w in output['Windows']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())